@@ -1,8 +1,12 @@
 import json
 import unidecode
 import os
+from types import MappingProxyType
 from dotenv import load_dotenv
 from openai import OpenAI
+from database_file import database_file
+from geo import GeoGridIndex, haversine_matrix, top_k
+from search_index import SearchIndex
 
 # Load biến môi trường từ file .env
 load_dotenv()
@@ -17,96 +21,214 @@ if not api_key:
 
 client = OpenAI(api_key=api_key)
 print("[AI_RECOMMEND] OpenAI client initialized successfully")
-def loadDestination():
-   
-    destinations = []
-    with open("database.json", "r", encoding = "utf-8") as f:
-        data = json.load(f)
+
+DESTINATIONS_FILE = "database.json"
+
+def _parse_destination(destination):
+    """Chuẩn hóa một địa điểm trong database.json (thêm search_words, search_phrases)."""
+    raw_tags = destination.get("tags", [])
+    dest_name = destination.get("name", "") # Lấy tên
+    display_tags = [tag.strip().lower() for tag in raw_tags]
+    search_words = set()
+
+    search_phrases = []
+
+    # --- Xử lý TÊN ---
+    # Ví dụ: "Chợ Bến Thành" -> "cho ben thanh"
+    norm_name = unidecode.unidecode(dest_name.lower())
+    # Thêm cụm từ "cho ben thanh" vào danh sách
+    search_phrases.append(norm_name)
+    # Tách "cho ben thanh" thành {"cho", "ben", "thanh"}
+    search_words.update(norm_name.split())
     
-    for destination in data:
-        raw_tags = destination.get("tags", [])
-        dest_name = destination.get("name", "") # Lấy tên
-        display_tags = [tag.strip().lower() for tag in raw_tags]
-        search_words = set()
-
-        search_phrases = []
-
-        # --- Xử lý TÊN ---
-        # Ví dụ: "Chợ Bến Thành" -> "cho ben thanh"
-        norm_name = unidecode.unidecode(dest_name.lower())
-        # Thêm cụm từ "cho ben thanh" vào danh sách
-        search_phrases.append(norm_name)
-        # Tách "cho ben thanh" thành {"cho", "ben", "thanh"}
-        search_words.update(norm_name.split())
+    # --- Xử lý TAGS ---
+    for tag in raw_tags:
+        # Ví dụ: "vui chơi" -> "vui choi"
+        norm_tag_phrase = unidecode.unidecode(tag.lower())
+        
+        # Thêm cụm từ "vui choi" vào danh sách
+        search_phrases.append(norm_tag_phrase)
         
-        # --- Xử lý TAGS ---
-        for tag in raw_tags:
-            # Ví dụ: "vui chơi" -> "vui choi"
-            norm_tag_phrase = unidecode.unidecode(tag.lower())
-            
-            # Thêm cụm từ "vui choi" vào danh sách
-            search_phrases.append(norm_tag_phrase)
-            
-            # Tách "vui choi" thành {"vui", "choi"}
-            search_words.update(norm_tag_phrase.split())
+        # Tách "vui choi" thành {"vui", "choi"}
+        search_words.update(norm_tag_phrase.split())
+    
+    # Thêm các trường đã xử lý vào dictionary
+    return {
+        "name" : dest_name, # Tên gốc
+        "location" : destination.get("location"),
+        "tags" : display_tags, # Tag gốc
         
-        # Thêm các trường đã xử lý vào dictionary
-        destinations.append({
-            "name" : dest_name, # Tên gốc
-            "location" : destination.get("location"),
-            "tags" : display_tags, # Tag gốc
-            
-            # 2 trường mới dùng cho tìm kiếm SIÊU CHÍNH XÁC
-            "search_words": search_words,   # Set: {"vui", "choi", "thao", "cam", "vien"...}
-            "search_phrases": search_phrases, # List: ["vui choi", "thao cam vien"...]
-            
-            "introduction" : destination.get("introduction"),
-            "price" : destination.get("price (VNĐ)"),
-            "rating" : destination.get("rating"),
-            "lat" : destination.get("lat"),
-            "lon" : destination.get("lon"),
-            "review" : destination.get("review"),
-            "province" : destination.get("province"),
-            "images": destination.get("images", [])
-        })
-
-    return destinations
-
-#Tính độ tương thích địa điểm
-def compatibality_rate(preference, destination):
+        # 2 trường mới dùng cho tìm kiếm SIÊU CHÍNH XÁC
+        "search_words": search_words,   # Set: {"vui", "choi", "thao", "cam", "vien"...}
+        "search_phrases": search_phrases, # List: ["vui choi", "thao cam vien"...]
+        
+        "introduction" : destination.get("introduction"),
+        "price" : destination.get("price (VNĐ)"),
+        "rating" : destination.get("rating"),
+        "lat" : destination.get("lat"),
+        "lon" : destination.get("lon"),
+        "review" : destination.get("review"),
+        "province" : destination.get("province"),
+        "images": destination.get("images", [])
+    }
+
+def loadDestination():
+    """Đọc database.json, trả về bản sao mới (có thể sửa) của danh sách địa điểm."""
+    with open(DESTINATIONS_FILE, "r", encoding = "utf-8") as f:
+        data = json.load(f)
+    return [_parse_destination(destination) for destination in data]
+
+def _rating(destination):
+    try:
+        return float(destination.get("rating") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+# Ngưỡng rating của nhóm địa điểm dùng cho /api/destinations/random
+HIGH_RATING_THRESHOLD = 4.5
+
+class DestinationCatalog:
     """
-    Hàm này được SỬA LẠI (LOGIC MỚI).
-    Chỉ trả về kết quả nếu TẤT CẢ các từ bạn gõ
-    đều có trong Tên hoặc Tags của địa điểm.
+    Danh sách địa điểm từ database.json (loader dùng chung database_file),
+    dựng lại khi file được load lại.
+    
+    Mỗi địa điểm là bản ghi chỉ đọc (MappingProxyType, search_words là frozenset).
+    Giữ sẵn các view: sắp theo rating, nhóm rating cao, tên -> địa điểm,
+    tag -> danh sách địa điểm, chỉ mục tìm kiếm BM25, chỉ mục không gian và mảng tọa độ.
     """
-    score = 0
-    pref_words = set(unidecode.unidecode(preference.lower()).split())
-    
-    # Nếu người dùng không gõ gì, không làm gì cả
-    if not pref_words:
-        return 0
-
-    # 2. Lấy TẬP HỢP TỪ KHÓA của địa điểm (đã xử lý ở loadDestination)
-    # Ví dụ: {"cho", "ben", "thanh", "mua", "sam", ...}
-    dest_words = destination.get("search_words", set())
-    if pref_words.issubset(dest_words):
-        score = 10 + len(pref_words)
+    
+    def __init__(self, source=database_file):
+        self.source = source
+    
+    @staticmethod
+    def _freeze(record):
+        record = dict(record)
+        record["tags"] = tuple(record["tags"])
+        record["search_words"] = frozenset(record["search_words"])
+        record["search_phrases"] = tuple(record["search_phrases"])
+        record["images"] = tuple(record["images"] or ())
+        return MappingProxyType(record)
+    
+    @classmethod
+    def _build(cls, data, version=None):
+        """Tạo toàn bộ view từ dữ liệu database.json."""
+        destinations = tuple(cls._freeze(_parse_destination(item)) for item in data)
+        
+        by_name = {}
+        tag_postings = {}
+        for dest in destinations:
+            by_name.setdefault(dest["name"], dest)
+            for phrase in dest["search_phrases"][1:]:
+                postings = tag_postings.setdefault(phrase.strip(), [])
+                if not postings or postings[-1] is not dest:
+                    postings.append(dest)
         
-    return score
+        by_rating = tuple(sorted(destinations, key=_rating, reverse=True))
+        located = tuple(dest for dest in destinations if dest.get("lat") is not None and dest.get("lon") is not None)
+        return {
+            # mtime của file đã tạo ra state này (dùng làm version cho cache response)
+            "mtime": version,
+            "destinations": destinations,
+            "by_rating": by_rating,
+            "high_rated": tuple(dest for dest in destinations if _rating(dest) >= HIGH_RATING_THRESHOLD),
+            "by_name": by_name,
+            "tag_postings": {tag: tuple(postings) for tag, postings in tag_postings.items()},
+            "search_index": SearchIndex(destinations),
+            "spatial_index": GeoGridIndex((dest["lat"], dest["lon"], dest) for dest in located),
+            # Mảng tọa độ cho các phép tính khoảng cách hàng loạt
+            "coords": (
+                located,
+                [float(dest["lat"]) for dest in located],
+                [float(dest["lon"]) for dest in located]
+            )
+        }
+    
+    def state(self):
+        """Trạng thái hiện tại (đã load lại nếu file đổi); các view trong cùng state luôn khớp nhau."""
+        return self.source.view("destination_catalog", self._build)
+    
+    @property
+    def destinations(self):
+        return self.state()["destinations"]
+    
+    @property
+    def by_rating(self):
+        """Địa điểm sắp theo rating giảm dần."""
+        return self.state()["by_rating"]
+    
+    @property
+    def high_rated(self):
+        """Địa điểm có rating >= HIGH_RATING_THRESHOLD."""
+        return self.state()["high_rated"]
+    
+    @property
+    def spatial_index(self):
+        return self.state()["spatial_index"]
+    
+    def search(self, query, limit=5):
+        """Tìm địa điểm theo sở thích (BM25): [(điểm, địa điểm)]."""
+        return self.state()["search_index"].search(query, limit=limit)
+    
+    def get(self, name):
+        """Địa điểm theo tên chính xác, None nếu không có."""
+        return self.state()["by_name"].get(name)
+    
+    def with_tag(self, tag):
+        """Các địa điểm có tag (không phân biệt hoa thường, dấu)."""
+        return self.state()["tag_postings"].get(unidecode.unidecode(tag.strip().lower()), ())
+    
+    def with_any_tag(self, tags):
+        """Các địa điểm có ít nhất một tag trong danh sách, giữ thứ tự trong database."""
+        state = self.state()
+        matched = set()
+        for tag in tags:
+            postings = state["tag_postings"].get(unidecode.unidecode(tag.strip().lower()), ())
+            matched.update(id(dest) for dest in postings)
+        return [dest for dest in state["destinations"] if id(dest) in matched]
 
-#Recommend theo tags
-def recommend(preference, destination):
-    preference = preference.lower()
+def nearby_destinations(lat, lon, radius_km, limit=None):
+    """Địa điểm trong bán kính radius_km (tối đa limit điểm gần nhất): [(km, địa điểm)]."""
+    index = destination_catalog.spatial_index
+    if limit:
+        return index.knn(lat, lon, limit, max_km=radius_km)
+    return index.within(lat, lon, radius_km)
 
-    results = []
-    for dest in destination:
-        score = compatibality_rate(preference, dest)
-        if score > 0:
-            results.append((dest, score))
-    #Sắp xếp giảm dần theo điểm số tương thích
-    results.sort(key = lambda x : x[1], reverse = True)
+def destination_distances(points, names=None, k=None):
+    """
+    Khoảng cách từ nhiều điểm (lat, lon) tới các địa điểm, tính vectorized.
 
-    return [d[0] for d in results[:5]]
+    Args:
+        points: Danh sách (lat, lon) của các điểm nguồn
+        names: Chỉ tính tới các địa điểm có tên trong danh sách (None = tất cả)
+        k: Nếu có, chỉ lấy k địa điểm gần nhất cho mỗi điểm nguồn
+
+    Returns:
+        (danh sách địa điểm đích, ma trận khoảng cách km) hoặc
+        (danh sách địa điểm đích, (chỉ số, khoảng cách)) khi có k
+    """
+    located, lats, lons = destination_catalog.state()["coords"]
+    if names is not None:
+        wanted = set(names)
+        selected = [i for i, dest in enumerate(located) if dest["name"] in wanted]
+        located = [located[i] for i in selected]
+        lats = [lats[i] for i in selected]
+        lons = [lons[i] for i in selected]
+
+    distances = haversine_matrix([p[0] for p in points], [p[1] for p in points], lats, lons)
+    if k is not None:
+        return located, top_k(distances, k)
+    return located, distances
+
+#Recommend theo tags
+def recommend(preference, destination, limit=5):
+    """Gợi ý địa điểm theo sở thích, xếp hạng BM25 (tên, tags, giới thiệu, review)."""
+    # Danh sách của catalog đã có chỉ mục sẵn, danh sách khác thì build tạm
+    state = destination_catalog.state()
+    if destination is state["destinations"]:
+        index = state["search_index"]
+    else:
+        index = SearchIndex(destination)
+    return [dest for _, dest in index.search(preference, limit=limit)]
 
 #Recommend bằng AI (sử dụng OpenAI API)
 def ai_recommend(user_input, places_data):
@@ -152,4 +274,5 @@ Hãy gợi ý 3 địa điểm phù hợp nhất và giải thích ngắn gọn
         return f"⚠️ Lỗi khi gọi OpenAI API: {str(e)[:100]}\n\nVui lòng kiểm tra API key trong file .env"
 
 
-    
+# Global instance
+destination_catalog = DestinationCatalog()
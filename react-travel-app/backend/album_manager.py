@@ -1,10 +1,21 @@
 import json
+import os
+import time
 from datetime import datetime
 from io import BytesIO
-from zipfile import ZipFile, ZIP_DEFLATED
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
 from PIL import Image, ImageDraw, ImageFont
 import textwrap
-import streamlit as st
+
+# streamlit chỉ cần cho các bản demo, backend FastAPI không cài
+try:
+    import streamlit as st
+except ImportError:
+    st = None
+
+# Định dạng đã nén sẵn: deflate lại gần như không giảm dung lượng
+PRECOMPRESSED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".heif", ".zip"}
+ZIP_CHUNK_SIZE = 64 * 1024
 
 def zip_album(album_name, items):
     """Tạo file ZIP chứa tất cả ảnh trong album."""
@@ -15,6 +26,77 @@ def zip_album(album_name, items):
     buf.seek(0)
     return buf
 
+class _ZipChunkSink:
+    """File-like chỉ ghi (không seek) để gom bytes ZipFile ghi ra và trả dần cho generator."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Lấy ra các bytes đã ghi kể từ lần drain trước."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _iter_zip_source(source, chunk_size):
+    """Đọc nguồn dữ liệu của entry theo từng chunk (đường dẫn file hoặc bytes)."""
+    if isinstance(source, (bytes, bytearray)):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+        return
+    with open(source, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def stream_zip(entries, chunk_size=ZIP_CHUNK_SIZE):
+    """
+    Tạo file ZIP dạng stream, yield từng chunk bytes ngay khi được ghi.
+    
+    Args:
+        entries: Danh sách (tên file trong ZIP, đường dẫn file hoặc bytes)
+        chunk_size: Kích thước mỗi lần đọc nguồn
+    
+    Returns:
+        Generator các chunk bytes của file ZIP
+    """
+    sink = _ZipChunkSink()
+    with ZipFile(sink, "w") as zf:
+        for arcname, source in entries:
+            zinfo = ZipInfo(arcname, date_time=time.localtime()[:6])
+            zinfo.external_attr = 0o644 << 16
+            extension = os.path.splitext(arcname)[1].lower()
+            # JPEG/PNG đã nén sẵn: lưu thẳng (STORED) để không tốn CPU vô ích
+            zinfo.compress_type = ZIP_STORED if extension in PRECOMPRESSED_EXTENSIONS else ZIP_DEFLATED
+            
+            with zf.open(zinfo, "w") as dest:
+                for chunk in _iter_zip_source(source, chunk_size):
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory được ghi khi đóng ZipFile
+    data = sink.drain()
+    if data:
+        yield data
+
 def create_pdf_album(album_items):
     """Tạo file PDF từ album ảnh với thông tin chi tiết."""
     if not album_items:
@@ -26,7 +108,7 @@ def create_pdf_album(album_items):
         font_bold = ImageFont.truetype("DejaVuSans-Bold.ttf", 18)
     except IOError:
         # Fallback nếu không tìm thấy font
-        if 'st' in globals():
+        if st is not None:
             st.warning("Không tìm thấy font 'DejaVuSans', sử dụng font mặc định (có thể lỗi tiếng Việt).")
         font = ImageFont.load_default()
         font_bold = ImageFont.load_default()
@@ -0,0 +1,110 @@
+"""
+Album Store Module - Lưu metadata album theo từng user
+Mỗi user có một file JSON riêng trong ALBUMS_DIR, ghi nguyên tử (file tạm + rename)
+và có lock riêng cho từng user để các lần ghi đồng thời không làm mất dữ liệu.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from threading import Lock, RLock
+from typing import Dict
+
+from atomic_file import replace_file
+
+# Thư mục chứa file album của từng user
+ALBUMS_DIR = "user_albums"
+# File album cũ (tất cả user trong một file)
+LEGACY_ALBUM_FILE = "Users_album.json"
+# Đánh dấu đã tách file cũ
+MIGRATION_MARKER = ".migrated"
+
+
+class AlbumStore:
+    """Kho metadata album, mỗi user một bản ghi."""
+
+    def __init__(self, root: str = ALBUMS_DIR, legacy_file: str = LEGACY_ALBUM_FILE):
+        self.root = root
+        self.legacy_file = legacy_file
+        os.makedirs(self.root, exist_ok=True)
+
+        # Lock theo user + lock bảo vệ dict các lock
+        self._user_locks: Dict[str, RLock] = {}
+        self._locks_lock = Lock()
+
+        self._migrate_legacy_file()
+
+    def _user_path(self, user_email: str) -> str:
+        """Đường dẫn file album của user (tên file là hash của email)."""
+        key = hashlib.sha256(user_email.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, f"{key}.json")
+
+    def user_lock(self, user_email: str) -> RLock:
+        """Lock dùng để tuần tự hóa các lần ghi của một user."""
+        with self._locks_lock:
+            lock = self._user_locks.get(user_email)
+            if lock is None:
+                lock = RLock()
+                self._user_locks[user_email] = lock
+            return lock
+
+    def load(self, user_email: str) -> Dict:
+        """Tải album của user, trả về {} nếu chưa có."""
+        path = self._user_path(user_email)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[ALBUM STORE] Could not read albums of {user_email}: {e}")
+            return {}
+        return record.get("albums", {})
+
+    def save(self, user_email: str, albums: Dict):
+        """Ghi album của user một cách nguyên tử."""
+        record = {"email": user_email, "albums": albums}
+        with self.user_lock(user_email):
+            self._atomic_write(self._user_path(user_email), record)
+
+    def _atomic_write(self, path: str, data: Dict):
+        """Ghi ra file tạm cùng thư mục rồi rename đè lên file đích."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp_", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            replace_file(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _migrate_legacy_file(self):
+        """Tách Users_album.json cũ thành file riêng cho từng user (chạy một lần)."""
+        marker = os.path.join(self.root, MIGRATION_MARKER)
+        if os.path.exists(marker) or not os.path.exists(self.legacy_file):
+            return
+        try:
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
+                all_albums = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[ALBUM STORE] Could not read legacy album file: {e}")
+            return
+
+        migrated = 0
+        for user_email, albums in all_albums.items():
+            # Không ghi đè dữ liệu mới hơn đã có trong store
+            if not os.path.exists(self._user_path(user_email)):
+                self.save(user_email, albums)
+                migrated += 1
+
+        with open(marker, "w", encoding="utf-8") as f:
+            f.write(self.legacy_file)
+        print(f"[ALBUM STORE] Migrated {migrated} user(s) from {self.legacy_file}")
+
+
+# Global instance
+album_store = AlbumStore()
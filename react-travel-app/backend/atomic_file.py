@@ -0,0 +1,23 @@
+"""
+Atomic File Module - Thay file đích bằng file tạm (os.replace) mà vẫn giữ quyền truy cập
+tempfile.mkstemp luôn tạo file 0600; nếu rename thẳng thì các process/user khác
+không đọc được file nữa.
+"""
+
+import os
+import stat
+
+# Quyền mặc định như open() tạo file mới: 0666 trừ umask của process
+_umask = os.umask(0)
+os.umask(_umask)
+DEFAULT_FILE_MODE = 0o666 & ~_umask
+
+
+def replace_file(tmp_path: str, path: str):
+    """Rename tmp_path đè lên path, giữ mode của file cũ (hoặc mode mặc định nếu chưa có)."""
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = DEFAULT_FILE_MODE
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
@@ -0,0 +1,103 @@
+"""
+Blob Store Module - Lưu ảnh trên đĩa theo nội dung (content-addressed)
+Mỗi ảnh được định danh bằng SHA-256 của bytes, lưu trong thư mục chia shard
+(ab/cd/abcd...) nên ảnh trùng nhau chỉ lưu một lần.
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from atomic_file import replace_file
+
+# Thư mục gốc chứa blobs
+BLOBS_DIR = "blobs"
+
+
+class BlobStore:
+    """Kho lưu bytes ảnh, khóa bằng SHA-256."""
+
+    def __init__(self, root: str = BLOBS_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        """Tính SHA-256 (hex) của bytes."""
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def is_valid_digest(digest: str) -> bool:
+        """Kiểm tra chuỗi có phải SHA-256 hex hợp lệ không."""
+        if not isinstance(digest, str) or len(digest) != 64:
+            return False
+        try:
+            int(digest, 16)
+            return True
+        except ValueError:
+            return False
+
+    def path(self, digest: str) -> str:
+        """Đường dẫn file của blob (shard theo 2 cấp thư mục)."""
+        if not self.is_valid_digest(digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        """Kiểm tra blob đã tồn tại chưa."""
+        try:
+            return os.path.exists(self.path(digest))
+        except ValueError:
+            return False
+
+    def put(self, data: bytes) -> str:
+        """Lưu bytes và trả về digest. Ảnh đã tồn tại thì không ghi lại."""
+        digest = self.digest(data)
+        target = self.path(digest)
+        if os.path.exists(target):
+            return digest
+
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+
+        # Ghi ra file tạm rồi rename để không bao giờ có blob ghi dở
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            replace_file(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Đọc bytes của blob, trả về None nếu không có."""
+        try:
+            with open(self.path(digest), "rb") as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def size(self, digest: str) -> Optional[int]:
+        """Kích thước blob (bytes), None nếu không có."""
+        try:
+            return os.path.getsize(self.path(digest))
+        except (OSError, ValueError):
+            return None
+
+    def delete(self, digest: str) -> bool:
+        """Xóa blob khỏi đĩa."""
+        try:
+            os.remove(self.path(digest))
+            return True
+        except (OSError, ValueError):
+            return False
+
+
+# Global instance
+blob_store = BlobStore()
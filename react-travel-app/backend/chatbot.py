@@ -1,7 +1,7 @@
 import json
 from datetime import datetime
 from typing import List, Optional
-from ai_recommend import ai_recommend, recommend, loadDestination
+from ai_recommend import ai_recommend, recommend, destination_catalog
 
 class TravelChatbot:
     """
@@ -9,10 +9,14 @@ class TravelChatbot:
     """
     
     def __init__(self):
-        self.destinations = loadDestination()
         self.conversation_history = []
         self.chat_sessions = {}
     
+    @property
+    def destinations(self):
+        """Danh sách địa điểm hiện tại (catalog tự load lại khi database.json thay đổi)."""
+        return destination_catalog.destinations
+    
     def format_destinations_for_ai(self, destinations: List[dict]) -> str:
         """
         Chuyển danh sách địa điểm thành chuỗi để gửi cho AI.
@@ -151,14 +155,7 @@ class TravelChatbot:
         """
         Tìm kiếm địa điểm theo danh sách tags.
         """
-        results = []
-        for dest in self.destinations:
-            dest_tags = [tag.lower() for tag in dest.get("tags", [])]
-            for search_tag in tags:
-                if search_tag.lower() in dest_tags:
-                    results.append(dest)
-                    break
-        return results
+        return destination_catalog.with_any_tag(tags)
     
     def search_by_price_range(self, min_price: int, max_price: int) -> List[dict]:
         """
@@ -180,12 +177,7 @@ class TravelChatbot:
         """
         Lấy các địa điểm được đánh giá cao nhất.
         """
-        sorted_dests = sorted(
-            self.destinations,
-            key=lambda x: float(x.get("rating", 0)),
-            reverse=True
-        )
-        return sorted_dests[:limit]
+        return list(destination_catalog.by_rating[:limit])
 
 
 # Khởi tạo chatbot global
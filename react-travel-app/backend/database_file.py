@@ -0,0 +1,88 @@
+"""
+Database File Module - database.json đọc một lần cho cả process, tự load lại khi file thay đổi
+Catalog địa điểm (ai_recommend) và registry địa danh (recognize) dùng chung một loader:
+file chỉ được kiểm tra mtime và parse ở một nơi, mỗi module dựng view riêng từ cùng dữ liệu.
+"""
+
+import json
+import os
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# File danh sách địa điểm/địa danh
+DATABASE_FILE = "database.json"
+# Khoảng thời gian tối thiểu giữa 2 lần kiểm tra mtime của file (giây)
+RELOAD_CHECK_INTERVAL = 2.0
+
+
+class DatabaseFile:
+    """
+    Nội dung database.json (tuple các item, không được sửa) kèm version là mtime của file.
+
+    view(tên, build) trả về kết quả build(dữ liệu, version), chỉ dựng lại khi file được load lại.
+    """
+
+    def __init__(self, path: str = DATABASE_FILE):
+        self.path = path
+        self._lock = Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        # (version, dữ liệu); version None khi chưa load được file
+        self._snapshot: Tuple[Optional[float], tuple] = (None, ())
+        # tên view -> (version, state)
+        self._views: Dict[str, Tuple[Optional[float], Any]] = {}
+        self._build_lock = Lock()
+
+    def _refresh(self):
+        """Load lại file nếu mtime thay đổi (kiểm tra tối đa mỗi vài giây)."""
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_INTERVAL and self._mtime is not None:
+            return
+        with self._lock:
+            self._last_check = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError as e:
+                if self._mtime is None:
+                    print(f"[DATABASE] Warning: Could not load {self.path}: {e}")
+                    self._mtime = 0
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._snapshot = (mtime, tuple(data))
+                print(f"[DATABASE] Loaded {len(data)} items from {self.path}")
+            except Exception as e:
+                print(f"[DATABASE] Warning: Could not load {self.path}: {e}")
+            self._mtime = mtime
+
+    def snapshot(self) -> Tuple[Optional[float], tuple]:
+        """(version, dữ liệu) hiện tại, đã load lại nếu file đổi."""
+        self._refresh()
+        return self._snapshot
+
+    def view(self, name: str, build: Callable[[tuple, Optional[float]], Any]) -> Any:
+        """View dựng từ dữ liệu hiện tại; lỗi khi dựng thì giữ view cũ."""
+        version, data = self.snapshot()
+        cached = self._views.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        with self._build_lock:
+            cached = self._views.get(name)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            try:
+                state = build(data, version)
+            except Exception as e:
+                print(f"[DATABASE] Warning: Could not build {name} from {self.path}: {e}")
+                state = cached[1] if cached is not None else build((), None)
+            self._views[name] = (version, state)
+            return state
+
+
+# Global instance
+database_file = DatabaseFile()
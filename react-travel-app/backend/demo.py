@@ -3,10 +3,10 @@ import recognize
 import album_manager
 import streamlit as st
 import pandas as pd
-from math import radians, sin, cos, asin, sqrt
 from datetime import datetime
 from io import BytesIO
 from PIL import Image
+from geo import haversine_matrix
 try:
     from streamlit_geolocation import streamlit_geolocation as geoloc
     _GEO_OK = True
@@ -34,14 +34,6 @@ if "active_album" not in st.session_state:
 
 
 
-def haversine_km(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    return R * c
-
 def screen_home():
     st.title("🧭 Demo UI du lịch")
     st.markdown("#### Trang chủ")
@@ -243,13 +235,13 @@ def screen_suggest():
 
         destinations = ai_recommend.loadDestination()
 
-        results = []
-        for d in destinations:
-            if d.get("lat") is None or d.get("lon") is None:
-                continue
-            dist = haversine_km(lat, lon, d["lat"], d["lon"])
-            if dist <= radius:
-                results.append({**d, "distance_km": dist})
+        located = [d for d in destinations if d.get("lat") is not None and d.get("lon") is not None]
+        distances = haversine_matrix([lat], [lon], [d["lat"] for d in located], [d["lon"] for d in located])[0]
+        results = [
+            {**d, "distance_km": float(dist)}
+            for d, dist in zip(located, distances)
+            if dist <= radius
+        ]
 
         if not results:
             st.warning("Không tìm thấy điểm nào trong bán kính đã chọn.")
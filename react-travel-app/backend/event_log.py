@@ -0,0 +1,82 @@
+"""
+Event Log Module - Write-ahead log dạng JSON Lines, chỉ ghi nối (append-only)
+Mỗi sự kiện là một dòng JSON, được flush + fsync trước khi trả về.
+Khi đọc lại, dòng cuối ghi dở (crash giữa chừng) bị bỏ qua và cắt khỏi file.
+"""
+
+import json
+import os
+from threading import Lock
+from typing import Dict, List
+
+
+class EventLog:
+    """File log các sự kiện, dùng kèm snapshot: replay khi khởi động, reset sau khi compact."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = Lock()
+        self._file = None
+        self._count = 0
+
+    def replay(self) -> List[Dict]:
+        """Đọc toàn bộ sự kiện trong log (gọi một lần khi khởi động, trước append)."""
+        with self._lock:
+            events = []
+            if not os.path.exists(self.path):
+                return events
+
+            valid_size = 0
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        break
+                    valid_size += len(line)
+
+                f.seek(0, os.SEEK_END)
+                if f.tell() > valid_size:
+                    print(f"[EVENT LOG] Dropping {f.tell() - valid_size} trailing byte(s) of torn write in {self.path}")
+            if os.path.getsize(self.path) > valid_size:
+                # Cắt phần ghi dở để lần append sau bắt đầu ở dòng mới
+                with open(self.path, "r+b") as f:
+                    f.truncate(valid_size)
+
+            self._count = len(events)
+            return events
+
+    def append(self, event: Dict):
+        """Ghi nối một sự kiện, chỉ trả về khi đã fsync xuống đĩa."""
+        line = json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            self._file.write(line.encode("utf-8"))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._count += 1
+
+    def reset(self):
+        """Xóa log sau khi mọi sự kiện đã nằm trong snapshot."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with open(self.path, "wb") as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self._count = 0
+
+    def __len__(self):
+        """Số sự kiện đang có trong log."""
+        return self._count
+
+    def size(self) -> int:
+        """Kích thước file log (bytes)."""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
@@ -0,0 +1,78 @@
+"""
+Feed Index Module - Chỉ mục theo thời gian cho feed, phân trang bằng cursor
+Khóa (created_at, post_id) được giữ sắp xếp bằng bisect khi thêm/xóa,
+lấy một trang chỉ tốn O(log n + limit) và không bị lệch khi có post mới.
+"""
+
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple
+
+FeedKey = Tuple[str, str]
+
+
+def encode_cursor(key: FeedKey) -> str:
+    """Cursor mờ (opaque) cho client từ khóa (created_at, post_id)."""
+    raw = json.dumps(list(key), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> FeedKey:
+    """Giải mã cursor, ValueError nếu cursor không hợp lệ."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, post_id = json.loads(raw)
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(created_at, str) or not isinstance(post_id, str):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return created_at, post_id
+
+
+class FeedIndex:
+    """Danh sách khóa (created_at, post_id) tăng dần; các trang trả về mới nhất trước."""
+
+    def __init__(self, keys=()):
+        self._keys: List[FeedKey] = sorted(keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key: FeedKey):
+        i = bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            self._keys.insert(i, key)
+
+    def remove(self, key: FeedKey):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def page(self, limit: int, before: Optional[FeedKey] = None, after: Optional[FeedKey] = None,
+             offset: int = 0) -> Tuple[List[FeedKey], bool]:
+        """
+        Một trang khóa, mới nhất trước.
+
+        Args:
+            limit: Số phần tử tối đa
+            before: Chỉ lấy phần tử cũ hơn khóa này (trang tiếp theo)
+            after: Chỉ lấy phần tử mới hơn khóa này (các post mới, sát ngay sau cursor)
+            offset: Bỏ qua offset phần tử mới nhất (khi không dùng cursor)
+
+        Returns:
+            (danh sách khóa, còn phần tử cũ hơn trang này hay không)
+        """
+        limit = max(0, limit)
+        if after is not None:
+            start = bisect_right(self._keys, after)
+            end = min(len(self._keys), start + limit)
+            if before is not None:
+                end = min(end, bisect_left(self._keys, before))
+        else:
+            end = bisect_left(self._keys, before) if before is not None else len(self._keys) - max(0, offset)
+            end = max(0, end)
+            start = max(0, end - limit)
+        keys = self._keys[start:end]
+        keys.reverse()
+        return keys, start > 0
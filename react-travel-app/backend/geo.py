@@ -0,0 +1,191 @@
+"""
+Geo Module - Khoảng cách haversine và chỉ mục không gian dạng lưới (grid)
+Điểm được chia vào các ô lat/lon cố định; truy vấn chỉ xét các ô quanh điểm cần tìm
+thay vì duyệt toàn bộ danh sách. Tính khoảng cách hàng loạt (ma trận, top-k) bằng NumPy.
+"""
+
+import heapq
+import math
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+# Số km trên một độ vĩ
+KM_PER_DEG_LAT = 111.32
+# Kích thước ô lưới mặc định (độ), ~1.1 km theo vĩ độ
+DEFAULT_CELL_DEG = 0.01
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Khoảng cách giữa 2 điểm trên mặt cầu (km)."""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.asin(math.sqrt(min(1.0, a)))
+
+
+def haversine_matrix(lats1: Sequence[float], lons1: Sequence[float],
+                     lats2: Sequence[float], lons2: Sequence[float]) -> np.ndarray:
+    """
+    Ma trận khoảng cách (km) giữa n điểm nguồn và m điểm đích.
+
+    Returns:
+        np.ndarray kích thước (n, m), phần tử [i, j] là khoảng cách điểm i tới điểm j
+    """
+    lat1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=np.float64))[None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def top_k(distances: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    k phần tử nhỏ nhất trên mỗi hàng của ma trận khoảng cách (argpartition, không sắp cả hàng).
+
+    Returns:
+        (chỉ số cột, khoảng cách), mỗi mảng kích thước (n, k), đã sắp tăng dần theo hàng
+    """
+    k = min(k, distances.shape[1])
+    if k <= 0:
+        empty = np.empty((distances.shape[0], 0))
+        return empty.astype(np.intp), empty
+    if k < distances.shape[1]:
+        indices = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.tile(np.arange(distances.shape[1]), (distances.shape[0], 1))
+    values = np.take_along_axis(distances, indices, axis=1)
+    order = np.argsort(values, axis=1, kind="stable")
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+class GeoGridIndex:
+    """Chỉ mục lưới cho các điểm (lat, lon, payload): tìm trong bán kính và điểm gần nhất."""
+
+    def __init__(self, points: Iterable[Tuple[float, float, Any]], cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells = {}
+        self._size = 0
+        for lat, lon, payload in points:
+            if lat is None or lon is None:
+                continue
+            lat, lon = float(lat), float(lon)
+            self._cells.setdefault(self._cell(lat, lon), []).append((lat, lon, payload))
+            self._size += 1
+        # Biên của lưới, dùng để biết khi nào đã duyệt hết
+        rows = [row for row, _ in self._cells]
+        cols = [col for _, col in self._cells]
+        self._bounds = (min(rows), max(rows), min(cols), max(cols)) if rows else None
+
+    def __len__(self):
+        return self._size
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def _span(self, lat: float, radius_km: float) -> Tuple[int, int]:
+        """Số ô cần xét theo mỗi chiều để phủ bán kính radius_km."""
+        dlat = radius_km / KM_PER_DEG_LAT
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        dlon = min(radius_km / (KM_PER_DEG_LAT * cos_lat), 180.0)
+        return int(math.ceil(dlat / self.cell_deg)), int(math.ceil(dlon / self.cell_deg))
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, Any]]:
+        """Các điểm trong bán kính radius_km, sắp theo khoảng cách: [(km, payload)]."""
+        if not self._size:
+            return []
+        # Bounding box quanh điểm: loại nhanh trước khi tính haversine
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlon = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        span_lat, span_lon = self._span(lat, radius_km)
+        row, col = self._cell(lat, lon)
+
+        results = []
+        if (2 * span_lat + 1) * (2 * span_lon + 1) > len(self._cells):
+            # Bán kính lớn: duyệt các ô hiện có sẽ nhanh hơn duyệt lưới
+            buckets = self._cells.values()
+        else:
+            buckets = (
+                self._cells.get((r, c), ())
+                for r in range(row - span_lat, row + span_lat + 1)
+                for c in range(col - span_lon, col + span_lon + 1)
+            )
+        for bucket in buckets:
+            for p_lat, p_lon, payload in bucket:
+                if abs(p_lat - lat) > dlat or abs(p_lon - lon) > dlon:
+                    continue
+                distance = haversine_km(lat, lon, p_lat, p_lon)
+                if distance <= radius_km:
+                    results.append((distance, payload))
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def _ring(self, row: int, col: int, ring: int):
+        """Các ô (đang có điểm) cách ô (row, col) đúng ring ô theo Chebyshev."""
+        if ring == 0:
+            yield self._cells.get((row, col), ())
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield self._cells.get((row - ring, c), ())
+            yield self._cells.get((row + ring, c), ())
+        for r in range(row - ring + 1, row + ring):
+            yield self._cells.get((r, col - ring), ())
+            yield self._cells.get((r, col + ring), ())
+
+    def knn(self, lat: float, lon: float, k: int, max_km: Optional[float] = None) -> List[Tuple[float, Any]]:
+        """
+        k điểm gần nhất (có thể giới hạn trong max_km), sắp theo khoảng cách: [(km, payload)].
+
+        Duyệt lưới theo từng vòng ô quanh điểm, dừng khi vòng tiếp theo chắc chắn
+        xa hơn điểm thứ k đã tìm được.
+        """
+        if k <= 0 or not self._size:
+            return []
+        row, col = self._cell(lat, lon)
+        min_row, max_row, min_col, max_col = self._bounds
+        last_ring = max(row - min_row, max_row - row, col - min_col, max_col - col, 0)
+
+        heap = []  # max-heap theo khoảng cách: (-km, thứ tự, payload)
+        counter = 0
+
+        def consider(bucket):
+            nonlocal counter
+            for p_lat, p_lon, payload in bucket:
+                distance = haversine_km(lat, lon, p_lat, p_lon)
+                if max_km is not None and distance > max_km:
+                    continue
+                counter += 1
+                if len(heap) < k:
+                    heapq.heappush(heap, (-distance, counter, payload))
+                elif distance < -heap[0][0]:
+                    heapq.heapreplace(heap, (-distance, counter, payload))
+
+        ring = 0
+        while ring <= last_ring:
+            if (2 * ring + 1) ** 2 > len(self._cells):
+                # Vòng quá rộng so với số ô có điểm: xét nốt các ô còn lại
+                for (r, c), bucket in self._cells.items():
+                    if max(abs(r - row), abs(c - col)) >= ring:
+                        consider(bucket)
+                break
+            for bucket in self._ring(row, col, ring):
+                consider(bucket)
+
+            # Khoảng cách tối thiểu tới mọi điểm ở vòng sau (hệ số 0.99 bù sai số xấp xỉ phẳng)
+            cos_lat = max(math.cos(math.radians(min(89.0, abs(lat) + (ring + 1) * self.cell_deg))), 1e-6)
+            gap_km = 0.99 * ring * self.cell_deg * KM_PER_DEG_LAT * cos_lat
+            if len(heap) == k and gap_km >= -heap[0][0]:
+                break
+            if max_km is not None and gap_km > max_km:
+                break
+            ring += 1
+
+        return [(-neg_distance, payload) for neg_distance, _, payload in sorted(heap, reverse=True)]
+
+    def nearest(self, lat: float, lon: float, max_km: float) -> Optional[Tuple[float, Any]]:
+        """Điểm gần nhất trong phạm vi max_km: (km, payload) hoặc None."""
+        found = self.within(lat, lon, max_km)
+        return found[0] if found else None
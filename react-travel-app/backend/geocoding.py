@@ -0,0 +1,234 @@
+"""
+Geocoding Module - Geocode / reverse geocode qua Nominatim có cache bền vững
+- Cache SQLite theo query đã chuẩn hóa và theo tọa độ làm tròn, có TTL
+- Giới hạn tốc độ phía client (Nominatim chỉ cho phép 1 request/giây)
+- Gộp các request giống nhau đang chạy để chỉ gọi mạng một lần
+- Khi mất mạng: dùng quận/huyện gần nhất trong vn_provinces_coords.csv
+"""
+
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import Future
+from threading import Lock
+from typing import Dict, List, Optional
+
+import unidecode
+from geopy.exc import GeocoderServiceError
+from geopy.geocoders import Nominatim
+
+from geo import haversine_matrix
+
+# File SQLite chứa cache
+GEOCODE_DB = "geocode_cache.db"
+# Thời gian sống của kết quả tìm thấy / không tìm thấy (giây)
+GEOCODE_TTL = int(os.getenv("GEOCODE_TTL", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))
+# Khoảng cách tối thiểu giữa 2 request tới Nominatim (giây)
+GEOCODE_MIN_INTERVAL = 1.0
+# Làm tròn tọa độ cho khóa reverse geocode (4 chữ số ~ 11 m)
+COORD_PRECISION = 4
+# File tọa độ quận/huyện dùng khi offline
+DISTRICTS_CSV = os.path.join(os.path.dirname(__file__), "vn_provinces_coords.csv")
+
+
+def load_districts(csv_path: str = DISTRICTS_CSV) -> List[Dict]:
+    """Đọc danh sách quận/huyện (district, name, lat, lon) từ CSV."""
+    districts = []
+    with open(csv_path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if row.get("district") and row.get("name") and row.get("lat") and row.get("lon"):
+                try:
+                    districts.append({
+                        "district": row["district"].strip(),
+                        "name": row["name"].strip(),
+                        "lat": float(row["lat"]),
+                        "lon": float(row["lon"])
+                    })
+                except ValueError:
+                    # Skip rows with invalid lat/lon
+                    continue
+    return districts
+
+
+def _normalize_query(query: str) -> str:
+    """Chuẩn hóa query làm khóa cache: chữ thường, bỏ dấu, gộp khoảng trắng."""
+    return " ".join(unidecode.unidecode(query.lower()).split())
+
+
+class CachedGeocoder:
+    """Geocoder Nominatim dùng chung cho cả process, có cache, rate limit và fallback offline."""
+
+    def __init__(self, db_path: str = GEOCODE_DB, user_agent: str = "travel_app_recognizer",
+                 timeout: int = 5, min_interval: float = GEOCODE_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+
+        self._db_lock = Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                kind TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                value TEXT,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (kind, cache_key)
+            )
+        """)
+
+        # Rate limit: thời điểm được phép gửi request tiếp theo
+        self._rate_lock = Lock()
+        self._next_request_at = 0.0
+
+        # Request đang chạy: (kind, key) -> Future
+        self._inflight_lock = Lock()
+        self._inflight: Dict[tuple, Future] = {}
+
+        self._districts: Optional[List[Dict]] = None
+        # (regex tên đã chuẩn hóa, độ dài tên, quận/huyện) cho fallback offline
+        self._district_patterns: Optional[List] = None
+
+    # ----- Cache -----
+    def _cache_get(self, kind: str, key: str):
+        """Trả về (True, value) nếu có trong cache và còn hạn, ngược lại (False, None)."""
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM geocode_cache WHERE kind = ? AND cache_key = ?",
+                (kind, key)
+            ).fetchone()
+        if not row or row[1] < time.time():
+            return False, None
+        return True, json.loads(row[0]) if row[0] is not None else None
+
+    def _cache_put(self, kind: str, key: str, value):
+        ttl = GEOCODE_TTL if value is not None else GEOCODE_NEGATIVE_TTL
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache (kind, cache_key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(value, ensure_ascii=False) if value is not None else None, time.time() + ttl)
+            )
+
+    # ----- Network -----
+    def _wait_for_slot(self):
+        """Chờ đến lượt gửi request (tối đa 1 request mỗi min_interval giây)."""
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_request_at - now
+            self._next_request_at = max(now, self._next_request_at) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _resolve(self, kind: str, key: str, fetch):
+        """Tra cache, nếu không có thì gọi fetch (gộp các lời gọi trùng khóa đang chạy)."""
+        hit, value = self._cache_get(kind, key)
+        if hit:
+            return value
+
+        with self._inflight_lock:
+            future = self._inflight.get((kind, key))
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[(kind, key)] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            self._wait_for_slot()
+            value = fetch()
+            self._cache_put(kind, key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop((kind, key), None)
+
+    # ----- Offline fallback -----
+    def _get_districts(self) -> List[Dict]:
+        if self._districts is None:
+            try:
+                self._districts = load_districts()
+            except OSError as e:
+                print(f"[GEOCODE] Could not load districts CSV: {e}")
+                self._districts = []
+        return self._districts
+
+    def nearest_district(self, lat: float, lon: float) -> Optional[Dict]:
+        """Quận/huyện gần tọa độ nhất trong CSV."""
+        districts = self._get_districts()
+        if not districts:
+            return None
+        distances = haversine_matrix([lat], [lon], [d["lat"] for d in districts], [d["lon"] for d in districts])[0]
+        return districts[int(distances.argmin())]
+
+    def _get_district_patterns(self) -> List:
+        if self._district_patterns is None:
+            patterns = []
+            for district in self._get_districts():
+                for name in (district["district"], district["name"]):
+                    key = _normalize_query(name)
+                    if key:
+                        # Khớp nguyên từ: "quan 1" không khớp trong "quan 10"
+                        patterns.append((re.compile(rf"(?<!\w){re.escape(key)}(?!\w)"), len(key), district))
+            self._district_patterns = patterns
+        return self._district_patterns
+
+    def _offline_geocode(self, query: str) -> Optional[Dict]:
+        """Tìm quận/huyện có tên xuất hiện (nguyên từ) trong query."""
+        normalized = _normalize_query(query)
+        best = None
+        for pattern, length, district in self._get_district_patterns():
+            if (best is None or length > best[0]) and pattern.search(normalized):
+                best = (length, district)
+        if not best:
+            return None
+        district = best[1]
+        return {"lat": district["lat"], "lon": district["lon"], "address": district["name"], "approximate": True}
+
+    # ----- Public API -----
+    def geocode(self, query: str) -> Optional[Dict]:
+        """Tìm tọa độ của địa điểm: {"lat", "lon", "address"} hoặc None."""
+        key = _normalize_query(query)
+        if not key:
+            return None
+
+        def fetch():
+            location = self._geolocator.geocode(query, language="vi")
+            if not location:
+                return None
+            return {"lat": location.latitude, "lon": location.longitude, "address": location.address}
+
+        try:
+            return self._resolve("geocode", key, fetch)
+        except GeocoderServiceError as e:
+            # Mất mạng / Nominatim lỗi: dùng dữ liệu offline
+            print(f"[GEOCODE] Geocoding unavailable ({e}), using offline fallback")
+            return self._offline_geocode(query)
+
+    def reverse(self, lat: float, lon: float) -> Optional[str]:
+        """Chuyển tọa độ thành địa chỉ."""
+        key = f"{round(lat, COORD_PRECISION)},{round(lon, COORD_PRECISION)}"
+
+        def fetch():
+            location = self._geolocator.reverse((lat, lon), language="vi")
+            return location.address if location else None
+
+        try:
+            return self._resolve("reverse", key, fetch)
+        except GeocoderServiceError as e:
+            print(f"[GEOCODE] Reverse geocoding unavailable ({e}), using nearest district")
+            district = self.nearest_district(lat, lon)
+            return f"{district['name']} (gần đúng)" if district else None
+
+
+# Global instance
+geocoder = CachedGeocoder()
@@ -0,0 +1,209 @@
+"""
+HTTP Cache Module - ETag, If-None-Match (304) và Range cho các response ảnh/file,
+và JSON tính sẵn (bytes + ETag + Last-Modified) cho các endpoint dữ liệu tĩnh
+"""
+
+import hashlib
+import json
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from threading import Lock
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+RANGE_CHUNK_SIZE = 64 * 1024
+# Serialize set/frozenset thành list đã sắp xếp thay vì theo thứ tự hash
+SORTED_SET_ENCODER = {set: sorted, frozenset: sorted}
+
+
+def make_etag(value: str) -> str:
+    """Tạo strong ETag từ một giá trị định danh nội dung (vd: SHA-256)."""
+    return f'"{value}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """So khớp header If-None-Match với ETag (so sánh yếu theo RFC 7232)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Đọc header Range dạng "bytes=start-end" (chỉ hỗ trợ một khoảng).
+
+    Returns:
+        (start, end) bao gồm cả end, None nếu không có/không hỗ trợ
+
+    Raises:
+        ValueError: Khoảng không thỏa mãn được (trả 416)
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        # Nhiều khoảng: trả toàn bộ file như RFC cho phép
+        return None
+
+    start_text, end_text = spec.split("-", 1)
+    try:
+        if start_text == "":
+            # Suffix range: N bytes cuối
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            start = max(size - length, 0)
+            end = size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        raise ValueError(f"Invalid range: {range_header}")
+
+    end = min(end, size - 1)
+    if start >= size or start > end:
+        raise ValueError(f"Unsatisfiable range: {range_header}")
+    return start, end
+
+
+def _iter_file_range(path: str, start: int, end: int):
+    """Đọc file từ start đến end (bao gồm) theo từng chunk."""
+    remaining = end - start + 1
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, path: str, etag: str, media_type: str,
+                  cache_control: str = "private, max-age=86400") -> Response:
+    """
+    Trả file từ đĩa với ETag, Cache-Control, hỗ trợ 304 và Range (206).
+
+    Args:
+        request: Request hiện tại (đọc If-None-Match, Range, If-Range)
+        path: Đường dẫn file
+        etag: Strong ETag của nội dung
+        media_type: Content-Type
+        cache_control: Giá trị header Cache-Control
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    size = os.path.getsize(path)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range không khớp: nội dung đã đổi, trả toàn bộ file
+    if range_header and if_range and if_range.strip() != etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        # Toàn bộ file: để FileResponse dùng sendfile
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
+
+
+def not_modified_since(if_modified_since: Optional[str], modified: float) -> bool:
+    """Kiểm tra header If-Modified-Since: nội dung không đổi kể từ thời điểm đó."""
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since is None:
+        return False
+    # Last-Modified chỉ chính xác đến giây
+    return int(modified) <= since.timestamp()
+
+
+class PrecomputedJSON:
+    """
+    Response JSON tính sẵn: bytes đã serialize, ETag và Last-Modified,
+    chỉ render lại khi version của nguồn dữ liệu thay đổi.
+
+    snapshot() trả về (version, thời điểm sửa đổi, dữ liệu nguồn);
+    render(dữ liệu nguồn) trả về object sẽ được serialize thành JSON.
+    """
+
+    def __init__(self, snapshot: Callable[[], Tuple[Any, float, Any]], render: Callable[[Any], Any],
+                 cache_control: str = "public, max-age=300"):
+        self.snapshot = snapshot
+        self.render = render
+        self.cache_control = cache_control
+        self._lock = Lock()
+        self._version = None
+        self._entry: Optional[Tuple[bytes, str, float]] = None
+
+    def get(self) -> Tuple[bytes, str, float]:
+        """(body, ETag, thời điểm sửa đổi) hiện tại, render lại nếu nguồn đã đổi."""
+        version, modified, source = self.snapshot()
+        with self._lock:
+            if self._entry is not None and self._version == version:
+                return self._entry
+
+        # Cùng định dạng với JSONResponse của FastAPI; set được sắp xếp
+        # để body và ETag không phụ thuộc thứ tự hash (PYTHONHASHSEED) của từng process
+        body = json.dumps(
+            jsonable_encoder(self.render(source), custom_encoder=SORTED_SET_ENCODER),
+            ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+        entry = (body, make_etag(hashlib.sha256(body).hexdigest()[:32]), modified or 0)
+
+        with self._lock:
+            self._version = version
+            self._entry = entry
+        return entry
+
+    def response(self, request: Request) -> Response:
+        """Trả JSON đã tính sẵn, 304 nếu client đã có bản hiện tại."""
+        body, etag, modified = self.get()
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(modified, usegmt=True),
+            "Cache-Control": self.cache_control,
+        }
+        if_none_match = request.headers.get("if-none-match")
+        # If-None-Match được ưu tiên hơn If-Modified-Since (RFC 7232)
+        if if_none_match is not None:
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers=headers)
+        elif not_modified_since(request.headers.get("if-modified-since"), modified):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,152 @@
+"""
+Image Variants Module - Tạo và cache ảnh thu nhỏ (thumbnail) nhiều kích thước
+Ảnh gốc lấy từ blob store, bản thu nhỏ 128/512/1600 px được tạo lần đầu khi cần
+(resize LANCZOS giống album_manager.create_pdf_album), lưu trên đĩa và dọn theo LRU.
+"""
+
+import os
+import tempfile
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+from atomic_file import replace_file
+from blob_store import blob_store
+
+# Thư mục cache bản thu nhỏ
+VARIANTS_DIR = "image_variants"
+# Các kích thước cạnh dài cho phép (px)
+VARIANT_SIZES = (128, 512, 1600)
+# Giới hạn dung lượng cache (bytes)
+VARIANTS_MAX_BYTES = int(os.getenv("IMAGE_VARIANTS_MAX_BYTES", str(512 * 1024 * 1024)))
+VARIANT_QUALITY = 80
+
+# Dùng WebP nếu Pillow hỗ trợ, nếu không thì JPEG
+if features.check("webp"):
+    VARIANT_FORMAT, VARIANT_EXTENSION, VARIANT_CONTENT_TYPE = "WEBP", ".webp", "image/webp"
+else:
+    VARIANT_FORMAT, VARIANT_EXTENSION, VARIANT_CONTENT_TYPE = "JPEG", ".jpg", "image/jpeg"
+
+
+def render_variant(image_bytes: bytes, size: int) -> bytes:
+    """Thu nhỏ ảnh để cạnh dài không vượt quá size, trả về bytes đã nén."""
+    img = Image.open(BytesIO(image_bytes))
+    # Xoay đúng chiều theo EXIF trước khi bỏ metadata
+    img = ImageOps.exif_transpose(img)
+
+    # JPEG không có kênh alpha; WebP giữ được nền trong suốt
+    if VARIANT_FORMAT == "WEBP" and "A" in img.getbands():
+        img = img.convert("RGBA")
+    else:
+        img = img.convert("RGB")
+
+    # Giữ tỷ lệ, không phóng to ảnh nhỏ
+    width, height = img.size
+    ratio = min(size / width, size / height, 1.0)
+    if ratio < 1.0:
+        new_size = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+
+    buf = BytesIO()
+    if VARIANT_FORMAT == "WEBP":
+        img.save(buf, format="WEBP", quality=VARIANT_QUALITY, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=VARIANT_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+class VariantCache:
+    """Cache bản thu nhỏ trên đĩa, dọn theo LRU khi vượt quá dung lượng."""
+
+    def __init__(self, blob_store, root: str = VARIANTS_DIR, max_bytes: int = VARIANTS_MAX_BYTES):
+        self.blob_store = blob_store
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+        self._lock = Lock()
+        # path -> size, thứ tự từ cũ nhất đến mới dùng nhất
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._scan()
+
+    def _scan(self):
+        """Khôi phục danh sách LRU từ đĩa (theo thời gian truy cập)."""
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith(".tmp_"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_atime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._total_bytes += size
+
+    def path(self, digest: str, size: int) -> str:
+        """Đường dẫn file bản thu nhỏ của blob."""
+        return os.path.join(self.root, digest[:2], f"{digest}_{size}{VARIANT_EXTENSION}")
+
+    def get(self, digest: str, size: int) -> Optional[Tuple[str, str]]:
+        """
+        Lấy bản thu nhỏ của blob, tạo mới nếu chưa có.
+
+        Returns:
+            (đường dẫn file, content type) hoặc None nếu không có ảnh gốc
+        """
+        if size not in VARIANT_SIZES:
+            raise ValueError(f"Unsupported variant size: {size}")
+        path = self.path(digest, size)
+
+        with self._lock:
+            if path in self._entries and os.path.exists(path):
+                self._entries.move_to_end(path)
+                return path, VARIANT_CONTENT_TYPE
+
+        original = self.blob_store.get(digest)
+        if original is None:
+            return None
+        data = render_variant(original, size)
+        self._write(path, data)
+        return path, VARIANT_CONTENT_TYPE
+
+    def _write(self, path: str, data: bytes):
+        """Ghi bản thu nhỏ (file tạm + rename) và dọn cache nếu cần."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            replace_file(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._total_bytes -= self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        """Xóa các bản thu nhỏ ít dùng nhất cho đến khi dưới giới hạn."""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_path, old_size = self._entries.popitem(last=False)
+            self._total_bytes -= old_size
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+
+# Global instance
+variant_cache = VariantCache(blob_store)
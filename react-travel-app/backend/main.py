@@ -1,33 +1,40 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends, Header, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Callable, List, Optional
 import json
 import math
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from io import BytesIO
 import base64
 from datetime import datetime, timedelta
 from PIL import Image
 import os
 import hashlib
+import threading
 import jwt
 
 # Import our modules
 try:
     from recognize import (
         analyze_image, get_landmark_from_image, get_landmark_with_confidence,
-        detect_location, OPENAI_ENABLED
+        detect_location, locate_image, OPENAI_ENABLED
+    )
+    from ai_recommend import (
+        recommend, loadDestination, ai_recommend, nearby_destinations, destination_distances,
+        destination_catalog
     )
-    from ai_recommend import recommend, loadDestination, ai_recommend
     from album_manager import (
-        zip_album, create_album_item, filter_album_items, 
+        zip_album, stream_zip, create_album_item, filter_album_items, 
         group_items_by_landmark, sort_items_by_date, add_images_to_album,
         get_album_stats
     )
     from chatbot import TravelChatbot, chatbot_instance
     from concurrent_login import login_manager
-    from social_feed import social_feed_manager
+    from social_feed import social_feed_manager, store_post_image
 except ImportError as e:
     print(f"Import error: {e}")
     # Fallback if modules not available
@@ -39,14 +46,29 @@ except ImportError as e:
         return {"landmark": "Module not available", "description": "", "confidence": "low"}
     def detect_location(*args, **kwargs):
         return "Module not available"
+    def locate_image(*args, **kwargs):
+        return {"landmark": "Module not available", "description": "", "confidence": "low", "source": "none"}
     def recommend(*args, **kwargs):
         return []
     def loadDestination():
         return []
+    def nearby_destinations(*args, **kwargs):
+        return []
+    def destination_distances(*args, **kwargs):
+        return [], []
+    class _EmptyCatalog:
+        destinations = by_rating = high_rated = ()
+        def state(self):
+            return {"mtime": 0, "destinations": (), "by_rating": (), "coords": ((), [], [])}
+        def search(self, *args, **kwargs):
+            return []
+    destination_catalog = _EmptyCatalog()
     def ai_recommend(*args, **kwargs):
         return "Module not available"
     def zip_album(*args, **kwargs):
         return None
+    def stream_zip(*args, **kwargs):
+        return iter(())
     def create_album_item(*args, **kwargs):
         return {}
     def filter_album_items(*args, **kwargs):
@@ -67,6 +89,15 @@ except ImportError as e:
     login_manager = None
     OPENAI_ENABLED = False
 
+from blob_store import blob_store
+from album_store import album_store
+from http_cache import file_response, make_etag, PrecomputedJSON
+from geocoding import load_districts, DISTRICTS_CSV
+from image_variants import variant_cache, VARIANT_SIZES
+from recognition_jobs import recognition_queue
+from recognition_cache import recognition_cache
+from recognition_strategies import strategy_engine
+
 app = FastAPI(title="Vietnam Travel App API")
 
 # ===== Authentication Configuration =====
@@ -102,56 +133,85 @@ def save_users(data: dict):
     with open(USERS_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=4)
 
+def _decode_legacy_image(item: dict) -> Optional[bytes]:
+    """Giải mã ảnh base64 kiểu cũ (image_data hoặc bytes) trong album item."""
+    for key in ("image_data", "bytes"):
+        value = item.get(key)
+        if isinstance(value, bytes) and value:
+            return value
+        if isinstance(value, str) and value:
+            # Bỏ prefix data URL nếu có (data:image/jpeg;base64,...)
+            if "base64," in value:
+                value = value.split("base64,", 1)[1]
+            try:
+                return base64.b64decode(value)
+            except Exception:
+                continue
+    return None
+
+def _migrate_album_item(item: dict) -> bool:
+    """Chuyển ảnh base64 inline của item sang blob store. Trả về True nếu item thay đổi."""
+    if "image_data" not in item and "bytes" not in item:
+        return False
+    image_bytes = _decode_legacy_image(item)
+    item.pop("image_data", None)
+    item.pop("bytes", None)
+    if image_bytes and not item.get("blob"):
+        item["blob"] = blob_store.put(image_bytes)
+        item["size"] = len(image_bytes)
+    return True
+
+def guess_image_content_type(filename: str) -> str:
+    """Đoán Content-Type của ảnh theo đuôi file."""
+    content_type = "image/jpeg"
+    if filename.lower().endswith('.png'):
+        content_type = "image/png"
+    elif filename.lower().endswith('.gif'):
+        content_type = "image/gif"
+    elif filename.lower().endswith('.webp'):
+        content_type = "image/webp"
+    return content_type
+
+def read_album_image(item: dict) -> Optional[bytes]:
+    """Đọc bytes ảnh của album item từ blob store (hoặc dữ liệu base64 cũ)."""
+    digest = item.get("blob")
+    if digest:
+        return blob_store.get(digest)
+    return _decode_legacy_image(item)
+
 def load_user_albums(user_email: str) -> dict:
-    """Tải album của người dùng theo email."""
-    if not os.path.exists(USERS_ALBUM_FILE):
-        return {}
-    try:
-        with open(USERS_ALBUM_FILE, "r", encoding="utf-8") as f:
-            all_albums = json.load(f)
-    except json.JSONDecodeError:
-        return {}
-    
-    user_album = all_albums.get(user_email, {})
-    loaded_albums = {}
-    for album_name, items in user_album.items():
-        loaded_albums[album_name] = []
-        for item in items:
-            new_item = item.copy()
-            if 'bytes' in new_item and isinstance(new_item['bytes'], str):
-                try:
-                    decoded_bytes = base64.b64decode(new_item['bytes'])
-                    new_item['bytes'] = decoded_bytes
-                except:
-                    new_item['bytes'] = None
-            loaded_albums[album_name].append(new_item)
+    """Tải album của người dùng theo email (chỉ metadata, ảnh nằm trong blob store)."""
+    with album_store.user_lock(user_email):
+        user_album = album_store.load(user_email)
+        loaded_albums = {}
+        migrated = False
+        for album_name, items in user_album.items():
+            loaded_albums[album_name] = []
+            for item in items:
+                new_item = item.copy()
+                # Dữ liệu cũ lưu base64 trong JSON: chuyển sang blob store một lần
+                if _migrate_album_item(new_item):
+                    migrated = True
+                loaded_albums[album_name].append(new_item)
+        
+        if migrated:
+            print(f"[ALBUM] Migrated inline images of {user_email} to blob store")
+            save_user_albums(user_email, loaded_albums)
     
     return loaded_albums
 
 def save_user_albums(user_email: str, user_albums: dict):
-    """Lưu album của người dùng theo email."""
-    if os.path.exists(USERS_ALBUM_FILE):
-        try:
-            with open(USERS_ALBUM_FILE, "r", encoding="utf-8") as f:
-                all_albums_data = json.load(f)
-        except json.JSONDecodeError:
-            all_albums_data = {}
-    else:
-        all_albums_data = {}
-
+    """Lưu album của người dùng theo email (ghi nguyên tử, chỉ file của user đó)."""
     albums_to_save = {}
     for album_name, items in user_albums.items():
         albums_to_save[album_name] = []
         for item in items:
             new_item = item.copy()
-            if 'bytes' in new_item and isinstance(new_item['bytes'], bytes):
-                encoded_bytes = base64.b64encode(new_item['bytes']).decode('utf-8')
-                new_item['bytes'] = encoded_bytes
+            # Không bao giờ ghi bytes ảnh vào JSON, chỉ lưu tham chiếu blob
+            _migrate_album_item(new_item)
             albums_to_save[album_name].append(new_item)
 
-    all_albums_data[user_email] = albums_to_save
-    with open(USERS_ALBUM_FILE, "w", encoding="utf-8") as f:
-        json.dump(all_albums_data, f, indent=4, ensure_ascii=False)
+    album_store.save(user_email, albums_to_save)
 
 def create_access_token(data: dict) -> str:
     """Tạo JWT token."""
@@ -235,6 +295,16 @@ class LocationRequest(BaseModel):
     latitude: float
     longitude: float
     radius: int = 50
+    limit: Optional[int] = None
+
+class GeoPoint(BaseModel):
+    latitude: float
+    longitude: float
+
+class DistanceMatrixRequest(BaseModel):
+    origins: List[GeoPoint]
+    destinations: Optional[List[str]] = None  # Tên địa điểm, None = tất cả
+    k: Optional[int] = None  # Chỉ trả về k địa điểm gần nhất cho mỗi điểm
 
 class AlbumCreateRequest(BaseModel):
     name: str
@@ -276,15 +346,108 @@ app.add_middleware(
 # In-memory album storage
 album_storage = {}
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Tính khoảng cách theo công thức haversine."""
-    import math
-    R = 6371.0  # Bán kính Trái Đất (km)
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    return R * c
+# ===== Landmark Recognition Helpers =====
+# Số lời gọi nhận dạng chạy song song tối đa (toàn server) và thời gian chờ mỗi ảnh
+RECOGNITION_CONCURRENCY = int(os.getenv("RECOGNITION_CONCURRENCY", "4"))
+RECOGNITION_TIMEOUT = float(os.getenv("RECOGNITION_TIMEOUT", "60"))
+# Số ảnh tối đa trong một request /api/recognize/batch
+RECOGNITION_BATCH_MAX = int(os.getenv("RECOGNITION_BATCH_MAX", "500"))
+
+# Lời gọi OpenAI là blocking: chạy trong thread pool riêng, không chặn event loop
+recognition_executor = ThreadPoolExecutor(
+    max_workers=RECOGNITION_CONCURRENCY,
+    thread_name_prefix="recognize"
+)
+
+def recognize_image_bytes(image_bytes: bytes) -> dict:
+    """Nhận dạng địa danh từ bytes ảnh (blocking)."""
+    image_pil = Image.open(BytesIO(image_bytes))
+    return get_landmark_with_confidence(image_pil)
+
+def _run_recognition(image_bytes: bytes, on_start: Callable[[], None]) -> dict:
+    """Chạy trong recognition_executor: báo đã được cấp worker rồi mới nhận dạng."""
+    on_start()
+    return recognize_image_bytes(image_bytes)
+
+async def recognize_image_async(image_bytes: bytes) -> dict:
+    """Nhận dạng địa danh trong thread pool, có timeout, không bao giờ raise."""
+    loop = asyncio.get_running_loop()
+    started = asyncio.Event()
+    try:
+        future = loop.run_in_executor(
+            recognition_executor, _run_recognition, image_bytes,
+            lambda: loop.call_soon_threadsafe(started.set)
+        )
+        # Thời gian chờ worker trống không tính vào timeout, chỉ tính thời gian nhận dạng
+        await started.wait()
+        return await asyncio.wait_for(future, timeout=RECOGNITION_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {
+            "landmark": "Không rõ địa danh",
+            "description": f"Lỗi: quá thời gian nhận dạng ({RECOGNITION_TIMEOUT:.0f}s)",
+            "confidence": "low"
+        }
+    except Exception as e:
+        return {
+            "landmark": "Không rõ địa danh",
+            "description": f"Lỗi: {str(e)[:50]}",
+            "confidence": "low"
+        }
+
+def _update_job_item(job: dict, fields: dict):
+    """Cập nhật item trong album ứng với job nhận dạng (nếu item còn tồn tại)."""
+    with album_store.user_lock(job["user_email"]):
+        user_albums = load_user_albums(job["user_email"])
+        for item in user_albums.get(job["album_name"], []):
+            if item.get("job_id") == job["job_id"]:
+                item.update(fields)
+                save_user_albums(job["user_email"], user_albums)
+                return
+
+def process_recognition_job(job: dict) -> dict:
+    """Worker nền: nhận dạng ảnh của job và ghi landmark/description/confidence vào album."""
+    image_bytes = blob_store.get(job["blob"])
+    if image_bytes is None:
+        raise ValueError(f"Blob không tồn tại: {job['blob']}")
+    
+    # Chạy trong recognition_executor để cùng giới hạn RECOGNITION_CONCURRENCY với request;
+    # như request, timeout chỉ tính từ lúc được cấp worker
+    started = threading.Event()
+    future = recognition_executor.submit(_run_recognition, image_bytes, started.set)
+    started.wait()
+    try:
+        result = future.result(timeout=RECOGNITION_TIMEOUT)
+    except FutureTimeoutError:
+        raise TimeoutError(f"Quá thời gian nhận dạng ({RECOGNITION_TIMEOUT:.0f}s)")
+    # Lỗi gọi API: raise để hàng đợi thử lại thay vì lưu "Lỗi" như kết quả
+    if result.get("error"):
+        raise RuntimeError(result["error"])
+    fields = {
+        "landmark": result.get("landmark", "N/A"),
+        "description": result.get("description", ""),
+        "confidence": result.get("confidence", "low"),
+        "recognition_status": "done"
+    }
+    _update_job_item(job, fields)
+    return fields
+
+def fail_recognition_job(job: dict, error: str):
+    """Đánh dấu item thất bại khi job hết số lần thử."""
+    _update_job_item(job, {
+        "landmark": "Không rõ địa danh",
+        "description": f"Lỗi: {error[:50]}",
+        "confidence": "low",
+        "recognition_status": "failed"
+    })
+
+@app.on_event("startup")
+def start_recognition_workers():
+    """Khởi động worker nhận dạng nền (chạy tiếp các job còn dở)."""
+    recognition_queue.start(process_recognition_job, on_failed=fail_recognition_job)
+
+@app.on_event("shutdown")
+def stop_recognition_workers():
+    recognition_queue.stop()
 
 # API Routes
 
@@ -622,20 +785,16 @@ async def recognize_landmark(file: UploadFile = File(...)):
 
 @app.post("/api/recognize/location")
 async def recognize_location(file: UploadFile = File(...)):
-    """Nhận dạng vị trí từ ảnh (GPS hoặc AI) - trả về tọa độ và địa chỉ."""
+    """Nhận dạng vị trí từ ảnh - ưu tiên GPS trong EXIF, chỉ gọi AI khi ảnh không có GPS
+    hoặc không chụp gần địa danh nào - trả về tọa độ và địa chỉ."""
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File phải là ảnh")
     
     try:
         image_bytes = await file.read()
-        image_pil = Image.open(BytesIO(image_bytes))
         
-        # Tạo file-like object từ bytes để detect_location có thể đọc EXIF
-        file_obj = BytesIO(image_bytes)
-        file_obj.name = file.filename
-        
-        # Gọi OpenAI Vision API để nhận dạng địa điểm
-        result = get_landmark_with_confidence(image_pil)
+        # Đọc EXIF / gọi OpenAI là blocking: chạy ngoài event loop
+        result = await run_in_threadpool(locate_image, image_bytes)
         
         # Lấy thông tin
         lat = result.get("lat")
@@ -657,24 +816,133 @@ async def recognize_location(file: UploadFile = File(...)):
             "coordinates": coordinates_str,
             "address": address or "Không có thông tin địa chỉ",
             "confidence": result.get("confidence", "low"),
+            "source": result.get("source"),
+            "distance_m": result.get("distance_m"),
             "display_text": f"🏛️ {landmark}\n📍 {coordinates_str}\n📮 {address or 'N/A'}" if lat else landmark
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/recognize/batch")
+async def recognize_batch(
+    files: List[UploadFile] = File(default=[]),
+    blobs: List[str] = Form(default=[]),
+    authorization: str = Header(None)
+):
+    """Nhận dạng nhiều ảnh trong một request, trả kết quả dạng NDJSON theo thứ tự hoàn thành.
+
+    Nhận file upload và/hoặc digest blob của ảnh trong album (cần token). Ảnh trùng
+    nội dung chỉ được nhận dạng một lần; mỗi dòng kết quả có "index" theo thứ tự gửi lên.
+    """
+    if not files and not blobs:
+        raise HTTPException(status_code=400, detail="Cần ít nhất một file hoặc blob")
+    if len(files) + len(blobs) > RECOGNITION_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Tối đa {RECOGNITION_BATCH_MAX} ảnh mỗi request")
+
+    # Blob phải thuộc album của user
+    owned_blobs = set()
+    if blobs:
+        user_email = verify_token(authorization)
+        for items in load_user_albums(user_email).values():
+            owned_blobs.update(item.get("blob") for item in items if item.get("blob"))
+
+    # (index, source, UploadFile hoặc None, digest hoặc None, lỗi). File upload chưa được đọc:
+    # mỗi task tự đọc file đã spool của nó nên chỉ vài ảnh nằm trong bộ nhớ cùng lúc
+    entries = []
+    for file in files:
+        index = len(entries)
+        if not file.content_type or not file.content_type.startswith('image/'):
+            entries.append((index, file.filename, None, None, "File phải là ảnh"))
+            continue
+        entries.append((index, file.filename, file, None, None))
+    for digest in blobs:
+        index = len(entries)
+        if digest not in owned_blobs:
+            entries.append((index, digest, None, None, "Blob không tồn tại trong album"))
+            continue
+        entries.append((index, digest, None, digest, None))
+
+    async def stream_results():
+        # Giới hạn số ảnh được đọc vào bộ nhớ và nhận dạng cùng lúc
+        semaphore = asyncio.Semaphore(RECOGNITION_CONCURRENCY)
+        # digest -> Future kết quả: ảnh trùng nội dung chỉ được nhận dạng một lần
+        recognitions = {}
+
+        async def run(index, source, file, digest):
+            async with semaphore:
+                image_bytes = None
+                if file is not None:
+                    image_bytes = await file.read()
+                    await file.close()
+                    digest = await run_in_threadpool(blob_store.digest, image_bytes)
+                pending = recognitions.get(digest)
+                if pending is None:
+                    pending = recognitions[digest] = asyncio.get_running_loop().create_future()
+                    try:
+                        if image_bytes is None:
+                            image_bytes = await run_in_threadpool(blob_store.get, digest)
+                        result = await recognize_image_async(image_bytes) if image_bytes is not None else None
+                        pending.set_result(result)
+                    except BaseException:
+                        pending.cancel()
+                        raise
+                # Bỏ bytes trước khi (có thể) chờ kết quả của ảnh trùng
+                image_bytes = None
+            return index, source, digest, await asyncio.shield(pending)
+
+        for index, source, _, _, error in entries:
+            if error:
+                yield json.dumps({"index": index, "source": source, "success": False, "error": error}, ensure_ascii=False) + "\n"
+
+        tasks = [
+            asyncio.ensure_future(run(index, source, file, digest))
+            for index, source, file, digest, error in entries if not error
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, source, digest, result = await next_done
+                if result is None:
+                    line = {"index": index, "source": source, "digest": digest, "success": False,
+                            "error": "Không đọc được ảnh"}
+                else:
+                    line = {"index": index, "source": source, "digest": digest, "success": True,
+                            "landmark": result.get("landmark", "Không rõ địa danh"),
+                            "description": result.get("description", ""),
+                            "confidence": result.get("confidence", "low"),
+                            "lat": result.get("lat"),
+                            "lon": result.get("lon"),
+                            "address": result.get("address")}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "total": len(entries), "unique": len(recognitions)}) + "\n"
+        finally:
+            # Client ngắt kết nối: hủy các ảnh chưa nhận dạng
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.get("/api/recognize/cache-stats")
+async def recognition_cache_stats():
+    """Thống kê cache nhận dạng (hit-rate, số bản ghi)."""
+    return {"success": True, "stats": recognition_cache.stats()}
+
+@app.get("/api/recognize/strategy-stats")
+async def recognition_strategy_stats():
+    """Thống kê tỷ lệ thành công của từng strategy nhận dạng (theo thứ tự sẽ thử)."""
+    return {"success": True, "strategies": strategy_engine.stats()}
+
 # Recommendation Routes
 @app.post("/api/recommend/interest")
 async def recommend_by_interest_api(request: InterestRequest):
     """Gợi ý địa điểm theo sở thích."""
     try:
-        destinations = loadDestination()
-        results = recommend(request.interest, destinations)
+        results = destination_catalog.search(request.interest, limit=5)
         # Convert to expected format
         formatted_results = []
-        for dest in results:
+        for score, dest in results:
             formatted_results.append({
                 "destination": dest,
-                "score": 5  # Default score
+                "score": score  # Điểm BM25
             })
         return {"success": True, "recommendations": formatted_results}
     except Exception as e:
@@ -684,7 +952,7 @@ async def recommend_by_interest_api(request: InterestRequest):
 async def ai_recommend_api(request: InterestRequest):
     """Gợi ý địa điểm bằng AI."""
     try:
-        destinations = loadDestination()
+        destinations = [dict(dest) for dest in destination_catalog.destinations]
         result = ai_recommend(request.interest, destinations)
         return {"success": True, "recommendation": result}
     except Exception as e:
@@ -692,75 +960,113 @@ async def ai_recommend_api(request: InterestRequest):
 
 @app.post("/api/recommend/nearby")
 async def recommend_nearby(request: LocationRequest):
-    """Gợi ý địa điểm gần vị trí hiện tại."""
+    """Gợi ý địa điểm gần vị trí hiện tại (tra qua chỉ mục không gian, limit = k điểm gần nhất)."""
     try:
-        destinations = loadDestination()
         results = []
+        for distance, dest in nearby_destinations(
+            request.latitude, request.longitude, request.radius, limit=request.limit
+        ):
+            dest_copy = dest.copy()
+            dest_copy["distance_km"] = round(distance, 2)
+            results.append(dest_copy)
         
-        for dest in destinations:
-            if dest.get("lat") and dest.get("lon"):
-                distance = haversine_distance(
-                    request.latitude, 
-                    request.longitude, 
-                    dest["lat"], 
-                    dest["lon"]
-                )
-                if distance <= request.radius:
-                    dest_copy = dest.copy()
-                    dest_copy["distance_km"] = round(distance, 2)
-                    results.append(dest_copy)
-        
-        # Sort by distance
-        results.sort(key=lambda x: x["distance_km"])
         return {"success": True, "destinations": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Số điểm nguồn tối đa cho một request distance-matrix
+DISTANCE_MATRIX_MAX_ORIGINS = 1000
+# Số ô tối đa của ma trận đầy đủ (origins x destinations); lớn hơn thì phải dùng k
+DISTANCE_MATRIX_MAX_CELLS = 20000
+
+def _distance_matrix_payload(request: DistanceMatrixRequest) -> dict:
+    """Tính khoảng cách và dựng response (CPU, chạy trong threadpool)."""
+    points = [(origin.latitude, origin.longitude) for origin in request.origins]
+    if request.k is not None:
+        targets, (indices, values) = destination_distances(points, names=request.destinations, k=request.k)
+        nearest = [
+            [{"name": targets[j]["name"], "distance_km": round(float(d), 3)} for j, d in zip(row_idx, row_val)]
+            for row_idx, row_val in zip(indices.tolist(), values.tolist())
+        ]
+        return {"success": True, "nearest": nearest}
+    
+    targets, distances = destination_distances(points, names=request.destinations)
+    return {
+        "success": True,
+        "destinations": [dest["name"] for dest in targets],
+        "matrix": [[round(d, 3) for d in row] for row in distances.tolist()]
+    }
+
+@app.post("/api/destinations/distance-matrix")
+async def destinations_distance_matrix(request: DistanceMatrixRequest):
+    """Khoảng cách (km) từ nhiều vị trí tới các địa điểm: ma trận đầy đủ hoặc k điểm gần nhất mỗi vị trí."""
+    if not request.origins:
+        raise HTTPException(status_code=400, detail="Cần ít nhất một vị trí")
+    if len(request.origins) > DISTANCE_MATRIX_MAX_ORIGINS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {DISTANCE_MATRIX_MAX_ORIGINS} vị trí mỗi request")
+    if request.k is not None and request.k <= 0:
+        raise HTTPException(status_code=400, detail="k phải lớn hơn 0")
+    if request.k is None:
+        # Số đích tối đa (trước khi lọc theo tên) để giới hạn kích thước ma trận đầy đủ
+        target_count = len(destination_catalog.state()["coords"][0])
+        if request.destinations is not None:
+            target_count = min(target_count, len(set(request.destinations)))
+        if len(request.origins) * target_count > DISTANCE_MATRIX_MAX_CELLS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Ma trận tối đa {DISTANCE_MATRIX_MAX_CELLS} ô, hãy dùng k để lấy các địa điểm gần nhất"
+            )
+    
+    try:
+        return await run_in_threadpool(_distance_matrix_payload, request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ===== Precomputed Catalog Responses =====
+# JSON của các endpoint dữ liệu tĩnh được serialize sẵn, chỉ tính lại khi file nguồn đổi
+def _catalog_snapshot():
+    state = destination_catalog.state()
+    return state["mtime"], state["mtime"], state
+
+def _districts_snapshot():
+    mtime = os.path.getmtime(DISTRICTS_CSV)
+    return mtime, mtime, DISTRICTS_CSV
+
+destinations_response = PrecomputedJSON(
+    _catalog_snapshot,
+    lambda state: {"success": True, "destinations": list(state["destinations"])}
+)
+# 6 địa điểm phổ biến: danh sách đã sắp theo rating giảm dần sẵn trong catalog
+popular_destinations_response = PrecomputedJSON(
+    _catalog_snapshot,
+    lambda state: {"success": True, "destinations": list(state["by_rating"][:6])}
+)
+districts_response = PrecomputedJSON(
+    _districts_snapshot,
+    lambda path: {"success": True, "districts": load_districts(path)}
+)
+
 @app.get("/api/destinations")
-async def get_all_destinations():
+async def get_all_destinations(request: Request):
     """Lấy tất cả địa điểm."""
     try:
-        destinations = loadDestination()
-        return {"success": True, "destinations": destinations}
+        return destinations_response.response(request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/destinations/popular")
-async def get_popular_destinations():
+async def get_popular_destinations(request: Request):
     """Lấy 6 địa điểm phổ biến dựa trên rating."""
     try:
-        destinations = loadDestination()
-        # Sắp xếp theo rating giảm dần và lấy 6 địa điểm đầu
-        sorted_destinations = sorted(destinations, key=lambda x: x.get('rating', 0), reverse=True)
-        popular = sorted_destinations[:6]
-        return {"success": True, "destinations": popular}
+        return popular_destinations_response.response(request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/districts")
-async def get_districts():
+async def get_districts(request: Request):
     """Lấy danh sách khu vực từ CSV."""
     try:
-        import csv
-        districts = []
-        csv_path = os.path.join(os.path.dirname(__file__), 'vn_provinces_coords.csv')
-        
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('district') and row.get('name') and row.get('lat') and row.get('lon'):
-                    try:
-                        districts.append({
-                            'district': row['district'].strip(),
-                            'name': row['name'].strip(),
-                            'lat': float(row['lat']),
-                            'lon': float(row['lon'])
-                        })
-                    except ValueError:
-                        # Skip rows with invalid lat/lon
-                        continue
-        
-        return {"success": True, "districts": districts}
+        return districts_response.response(request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -769,9 +1075,8 @@ async def get_random_destinations(count: int = 4):
     """Lấy địa điểm random có rating cao."""
     try:
         import random
-        destinations = loadDestination()
-        # Lọc những địa điểm có rating >= 4.5
-        high_rated = [d for d in destinations if d.get('rating', 0) >= 4.5]
+        # Những địa điểm có rating >= 4.5 (đã lọc sẵn trong catalog)
+        high_rated = destination_catalog.high_rated
         # Random chọn count địa điểm
         selected = random.sample(high_rated, min(count, len(high_rated)))
         return {"success": True, "destinations": selected}
@@ -783,13 +1088,14 @@ async def get_random_destinations(count: int = 4):
 async def create_album(request: AlbumCreateRequest, user_email: str = Depends(verify_token)):
     """Tạo album mới cho user đã đăng nhập."""
     try:
-        user_albums = load_user_albums(user_email)
-        
-        if request.name in user_albums:
-            return {"success": False, "message": "Album đã tồn tại"}
-        
-        user_albums[request.name] = []
-        save_user_albums(user_email, user_albums)
+        with album_store.user_lock(user_email):
+            user_albums = load_user_albums(user_email)
+            
+            if request.name in user_albums:
+                return {"success": False, "message": "Album đã tồn tại"}
+            
+            user_albums[request.name] = []
+            save_user_albums(user_email, user_albums)
         return {"success": True, "message": f"Đã tạo album '{request.name}'"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -815,18 +1121,19 @@ async def get_albums(user_email: str = Depends(verify_token)):
 async def delete_album(album_name: str, user_email: str = Depends(verify_token)):
     """Xóa album của user."""
     try:
-        user_albums = load_user_albums(user_email)
-        
-        # Debug logging
-        print(f"[DELETE ALBUM] User: {user_email}")
-        print(f"[DELETE ALBUM] Requested album name: '{album_name}'")
-        print(f"[DELETE ALBUM] Available albums: {list(user_albums.keys())}")
-        
-        if album_name not in user_albums:
-            return {"success": False, "message": f"Album không tồn tại. Available: {list(user_albums.keys())}"}
-        
-        del user_albums[album_name]
-        save_user_albums(user_email, user_albums)
+        with album_store.user_lock(user_email):
+            user_albums = load_user_albums(user_email)
+            
+            # Debug logging
+            print(f"[DELETE ALBUM] User: {user_email}")
+            print(f"[DELETE ALBUM] Requested album name: '{album_name}'")
+            print(f"[DELETE ALBUM] Available albums: {list(user_albums.keys())}")
+            
+            if album_name not in user_albums:
+                return {"success": False, "message": f"Album không tồn tại. Available: {list(user_albums.keys())}"}
+            
+            del user_albums[album_name]
+            save_user_albums(user_email, user_albums)
         print(f"[DELETE ALBUM] Successfully deleted album '{album_name}'")
         return {"success": True, "message": f"Đã xóa album '{album_name}'"}
     except Exception as e:
@@ -837,35 +1144,36 @@ async def delete_album(album_name: str, user_email: str = Depends(verify_token))
 async def delete_image_from_album(album_name: str, filename: str, user_email: str = Depends(verify_token)):
     """Xóa một ảnh cụ thể khỏi album."""
     try:
-        user_albums = load_user_albums(user_email)
+        with album_store.user_lock(user_email):
+            user_albums = load_user_albums(user_email)
         
-        print(f"[DELETE IMAGE] User: {user_email}")
-        print(f"[DELETE IMAGE] Album: '{album_name}'")
-        print(f"[DELETE IMAGE] Filename: '{filename}'")
+            print(f"[DELETE IMAGE] User: {user_email}")
+            print(f"[DELETE IMAGE] Album: '{album_name}'")
+            print(f"[DELETE IMAGE] Filename: '{filename}'")
         
-        if album_name not in user_albums:
-            print(f"[DELETE IMAGE] Album not found")
-            return {"success": False, "message": f"Album '{album_name}' không tồn tại"}
+            if album_name not in user_albums:
+                print(f"[DELETE IMAGE] Album not found")
+                return {"success": False, "message": f"Album '{album_name}' không tồn tại"}
         
-        # user_albums[album_name] is a list of image dictionaries
-        images = user_albums[album_name]
+            # user_albums[album_name] is a list of image dictionaries
+            images = user_albums[album_name]
         
-        print(f"[DELETE IMAGE] Current image count: {len(images)}")
-        print(f"[DELETE IMAGE] Images in album: {[img.get('filename') for img in images]}")
+            print(f"[DELETE IMAGE] Current image count: {len(images)}")
+            print(f"[DELETE IMAGE] Images in album: {[img.get('filename') for img in images]}")
         
-        # Find and remove the image
-        original_count = len(images)
-        images = [img for img in images if img.get("filename") != filename]
+            # Find and remove the image
+            original_count = len(images)
+            images = [img for img in images if img.get("filename") != filename]
         
-        if len(images) == original_count:
-            print(f"[DELETE IMAGE] Image not found in album")
-            return {"success": False, "message": f"Ảnh '{filename}' không tồn tại trong album"}
+            if len(images) == original_count:
+                print(f"[DELETE IMAGE] Image not found in album")
+                return {"success": False, "message": f"Ảnh '{filename}' không tồn tại trong album"}
         
-        # Update album with filtered images list
-        user_albums[album_name] = images
+            # Update album with filtered images list
+            user_albums[album_name] = images
         
-        # Save updated albums
-        save_user_albums(user_email, user_albums)
+            # Save updated albums
+            save_user_albums(user_email, user_albums)
         
         print(f"[DELETE IMAGE] Successfully deleted. Remaining: {len(images)}")
         return {
@@ -879,31 +1187,59 @@ async def delete_image_from_album(album_name: str, filename: str, user_email: st
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _save_album_items(user_email: str, album_name: str, new_items: List[dict], use_jobs: bool) -> List[str]:
+    """Lưu item mới vào album (blocking), trả về job_id của các job nhận dạng nền."""
+    # Ghi job (held) trước khi lưu item: server dừng giữa chừng thì job vẫn còn
+    # và được chạy ở lần khởi động sau, item không bị pending mãi
+    job_ids = []
+    if use_jobs:
+        for item in new_items:
+            recognition_queue.enqueue(item["job_id"], user_email, album_name, item["filename"], item["blob"],
+                                      held=True)
+            job_ids.append(item["job_id"])
+    
+    # Đọc - thêm - ghi trong lock của user để không mất ảnh của request khác
+    with album_store.user_lock(user_email):
+        user_albums = load_user_albums(user_email)
+        
+        # Create album if not exists
+        if album_name not in user_albums:
+            print(f"[ADD IMAGES] Creating new album: '{album_name}'")
+            user_albums[album_name] = []
+        else:
+            print(f"[ADD IMAGES] Album exists with {len(user_albums[album_name])} images")
+        
+        user_albums[album_name].extend(new_items)
+        save_user_albums(user_email, user_albums)
+    
+    # Item đã được lưu: cho worker xử lý job
+    recognition_queue.release(job_ids)
+    return job_ids
+
 @app.post("/api/albums/{album_name}/images")
 async def add_image_to_album(
     album_name: str,
     files: List[UploadFile] = File(...),
     auto_recognize: bool = Form(True),
+    background: bool = Form(True),
     user_email: str = Depends(verify_token)
 ):
-    """Thêm nhiều ảnh vào album với tùy chọn nhận dạng tự động."""
+    """Thêm nhiều ảnh vào album với tùy chọn nhận dạng tự động.
+    
+    background=True: trả về ngay, ảnh ở trạng thái pending và được nhận dạng bởi
+    worker nền (theo dõi qua /api/jobs/{job_id}). background=False: nhận dạng
+    song song ngay trong request.
+    """
     try:
         print(f"[ADD IMAGES] User: {user_email}")
         print(f"[ADD IMAGES] Album name: '{album_name}'")
         print(f"[ADD IMAGES] Number of files: {len(files)}")
         print(f"[ADD IMAGES] Auto recognize: {auto_recognize}")
         
-        user_albums = load_user_albums(user_email)
-        
-        # Create album if not exists
-        if album_name not in user_albums:
-            print(f"[ADD IMAGES] Creating new album: '{album_name}'")
-            user_albums[album_name] = []
-        else:
-            print(f"[ADD IMAGES] Album exists with {len(user_albums[album_name])} images")
-        
         success_count = 0
         errors = []
+        new_items = []
+        uploads = []
         
         for file in files:
             if not file.content_type.startswith('image/'):
@@ -912,49 +1248,47 @@ async def add_image_to_album(
             
             try:
                 image_bytes = await file.read()
-                landmark = "N/A"
-                description = ""
-                confidence = "low"
-                
-                if auto_recognize and OPENAI_ENABLED:
-                    try:
-                        image_pil = Image.open(BytesIO(image_bytes))
-                        # Use the new function that returns dict
-                        result = get_landmark_with_confidence(image_pil)
-                        landmark = result.get("landmark", "N/A")
-                        description = result.get("description", "")
-                        confidence = result.get("confidence", "low")
-                    except Exception as e:
-                        landmark = "Không rõ địa danh"
-                        description = f"Lỗi: {str(e)[:50]}"
-                        confidence = "low"
-                
-                # Encode image to base64
-                image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-                
-                item = {
-                    "filename": file.filename,
-                    "image_data": image_b64,
-                    "uploaded_at": datetime.now().isoformat(),
-                    "album_name": album_name,
-                    "landmark": landmark,
-                    "description": description,
-                    "confidence": confidence
-                }
-                
-                print(f"[DEBUG] Saving image to album: {file.filename}")
-                print(f"[DEBUG]   - Original bytes: {len(image_bytes)}")
-                print(f"[DEBUG]   - Base64 length: {len(image_b64)}")
-                print(f"[DEBUG]   - Has image_data: {'image_data' in item}")
-                
-                user_albums[album_name].append(item)
-                success_count += 1
-                
+                # Lưu ảnh vào blob store (ghi file + fsync, chạy ngoài event loop), album chỉ giữ tham chiếu
+                digest = await run_in_threadpool(blob_store.put, image_bytes)
+                uploads.append((file, image_bytes, digest))
             except Exception as e:
                 errors.append(f"{file.filename}: {str(e)}")
         
-        # Save albums to file
-        save_user_albums(user_email, user_albums)
+        use_jobs = auto_recognize and OPENAI_ENABLED and background
+        
+        # Nhận dạng tất cả ảnh song song (giới hạn bởi RECOGNITION_CONCURRENCY)
+        if auto_recognize and OPENAI_ENABLED and not background:
+            results = await asyncio.gather(
+                *(recognize_image_async(image_bytes) for _, image_bytes, _ in uploads)
+            )
+        else:
+            results = [{} for _ in uploads]
+        
+        for (file, image_bytes, digest), result in zip(uploads, results):
+            item = {
+                "filename": file.filename,
+                "blob": digest,
+                "size": len(image_bytes),
+                "content_type": file.content_type,
+                "uploaded_at": datetime.now().isoformat(),
+                "album_name": album_name,
+                "landmark": result.get("landmark", "N/A"),
+                "description": result.get("description", ""),
+                "confidence": result.get("confidence", "low")
+            }
+            if use_jobs:
+                item["job_id"] = recognition_queue.new_job_id()
+                item["recognition_status"] = "pending"
+            
+            print(f"[DEBUG] Saving image to album: {file.filename}")
+            print(f"[DEBUG]   - Original bytes: {len(image_bytes)}")
+            print(f"[DEBUG]   - Blob: {digest}")
+            
+            new_items.append(item)
+            success_count += 1
+        
+        # Ghi SQLite và file album (có lock, fsync) trong thread pool, không chặn event loop
+        job_ids = await run_in_threadpool(_save_album_items, user_email, album_name, new_items, use_jobs)
         
         print(f"[ADD IMAGES] Successfully added {success_count}/{len(files)} images")
         if errors:
@@ -965,7 +1299,8 @@ async def add_image_to_album(
             "message": f"Đã thêm {success_count}/{len(files)} ảnh vào album '{album_name}'",
             "added_count": success_count,
             "total_count": len(files),
-            "errors": errors
+            "errors": errors,
+            "job_ids": job_ids
         }
     except Exception as e:
         print(f"[ADD IMAGES] Exception: {str(e)}")
@@ -977,6 +1312,7 @@ async def add_image_to_album(
 async def get_album_images(
     album_name: str, 
     include_images: bool = False,
+    size: Optional[int] = None,
     search_landmark: Optional[str] = None,
     search_date: Optional[str] = None,
     user_email: str = Depends(verify_token)
@@ -998,10 +1334,25 @@ async def get_album_images(
             items = [item for item in items 
                     if datetime.fromisoformat(item['uploaded_at']).date().isoformat() == search_date]
         
-        if not include_images:
-            # Loại bỏ data ảnh để giảm kích thước response
+        if size is not None and size not in VARIANT_SIZES:
+            raise HTTPException(status_code=400, detail=f"size phải là một trong {list(VARIANT_SIZES)}")
+        
+        if include_images:
+            # Đọc ảnh từ blob store (hoặc bản thu nhỏ nếu có size) và trả về base64 như trước
             for item in items:
-                item.pop("image_data", None)
+                image_bytes = None
+                if size is not None and item.get("blob"):
+                    variant = await run_in_threadpool(variant_cache.get, item["blob"], size)
+                    if variant:
+                        try:
+                            with open(variant[0], "rb") as f:
+                                image_bytes = f.read()
+                        except OSError:
+                            # Bản thu nhỏ vừa bị dọn khỏi cache: dùng ảnh gốc
+                            image_bytes = None
+                if image_bytes is None:
+                    image_bytes = read_album_image(item)
+                item["image_data"] = base64.b64encode(image_bytes).decode('utf-8') if image_bytes else None
         
         return {
             "success": True, 
@@ -1009,12 +1360,23 @@ async def get_album_images(
             "total": len(items),
             "album_total": len(user_albums[album_name])
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/albums/{album_name}/images/{filename}/view")
-async def view_album_image(album_name: str, filename: str, token: str = Query(...)):
-    """Serve ảnh từ album để hiển thị."""
+async def view_album_image(
+    album_name: str,
+    filename: str,
+    request: Request,
+    token: str = Query(...),
+    size: Optional[int] = Query(None)
+):
+    """Serve ảnh từ album để hiển thị (file trực tiếp từ blob store, có ETag/Range).
+    
+    size: cạnh dài của bản thu nhỏ (128/512/1600), bỏ trống để lấy ảnh gốc.
+    """
     try:
         # Verify token từ query parameter
         user_email = verify_token_from_string(token)
@@ -1038,32 +1400,32 @@ async def view_album_image(album_name: str, filename: str, token: str = Query(..
         if not image_item:
             raise HTTPException(status_code=404, detail="Ảnh không tồn tại trong album")
         
-        # Lấy image_data (base64)
-        image_data = image_item.get("image_data")
-        if not image_data:
+        # Không decode gì cả: trả thẳng file blob, ETag chính là SHA-256 nội dung
+        digest = image_item.get("blob")
+        if not digest or not blob_store.exists(digest):
             raise HTTPException(status_code=404, detail="Dữ liệu ảnh không tồn tại")
         
-        # Decode base64
-        import base64
-        from io import BytesIO
-        from fastapi.responses import StreamingResponse
-        
-        # Remove data URI prefix if exists
-        if "," in image_data:
-            image_data = image_data.split(",", 1)[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        
-        # Determine content type
-        content_type = "image/jpeg"
-        if filename.lower().endswith('.png'):
-            content_type = "image/png"
-        elif filename.lower().endswith('.gif'):
-            content_type = "image/gif"
-        elif filename.lower().endswith('.webp'):
-            content_type = "image/webp"
+        if size is not None:
+            if size not in VARIANT_SIZES:
+                raise HTTPException(status_code=400, detail=f"size phải là một trong {list(VARIANT_SIZES)}")
+            # Tạo bản thu nhỏ lần đầu (CPU) ngoài event loop, các lần sau đọc từ cache
+            variant = await run_in_threadpool(variant_cache.get, digest, size)
+            if not variant:
+                raise HTTPException(status_code=404, detail="Dữ liệu ảnh không tồn tại")
+            variant_path, variant_type = variant
+            return file_response(
+                request,
+                variant_path,
+                etag=make_etag(f"{digest}-{size}"),
+                media_type=variant_type
+            )
         
-        return StreamingResponse(BytesIO(image_bytes), media_type=content_type)
+        return file_response(
+            request,
+            blob_store.path(digest),
+            etag=make_etag(digest),
+            media_type=image_item.get("content_type") or guess_image_content_type(filename)
+        )
         
     except HTTPException:
         raise
@@ -1094,76 +1456,35 @@ async def download_album(album_name: str, user_email: str = Depends(verify_token
         if items:
             first_item = items[0]
             print(f"[DEBUG] First item keys: {list(first_item.keys())}")
-            print(f"[DEBUG] First item has image_data: {'image_data' in first_item}")
-            print(f"[DEBUG] First item has bytes: {'bytes' in first_item}")
-            if 'image_data' in first_item:
-                img_data_len = len(first_item['image_data']) if first_item['image_data'] else 0
-                print(f"[DEBUG] image_data length: {img_data_len} chars")
-        
-        from zipfile import ZipFile, ZIP_DEFLATED
-        
-        buf = BytesIO()
-        added_count = 0
-        
-        with ZipFile(buf, "w", ZIP_DEFLATED) as zf:
-            for idx, item in enumerate(items):
-                try:
-                    filename = item.get("filename", f"image_{idx}.jpg")
-                    # Sanitize filename
-                    filename = filename.replace('/', '_').replace('\\', '_')
-                    
-                    image_bytes = None
-                    
-                    # Try different data formats
-                    # Priority 1: image_data (base64 string)
-                    if "image_data" in item and item["image_data"]:
-                        try:
-                            # Handle base64 encoded image
-                            img_data = item["image_data"]
-                            # Remove data URL prefix if present (data:image/jpeg;base64,...)
-                            if isinstance(img_data, str) and 'base64,' in img_data:
-                                img_data = img_data.split('base64,')[1]
-                            image_bytes = base64.b64decode(img_data)
-                            print(f"[DEBUG] Decoded base64 for {filename}: {len(image_bytes)} bytes")
-                        except Exception as e:
-                            print(f"[DEBUG] Failed to decode base64 for {filename}: {e}")
-                    
-                    # Priority 2: bytes field
-                    if image_bytes is None and "bytes" in item and item["bytes"]:
-                        # Use direct bytes
-                        if isinstance(item["bytes"], bytes):
-                            image_bytes = item["bytes"]
-                            print(f"[DEBUG] Using direct bytes for {filename}: {len(image_bytes)} bytes")
-                        elif isinstance(item["bytes"], str):
-                            # Maybe it's base64 string stored as bytes
-                            try:
-                                image_bytes = base64.b64decode(item["bytes"])
-                                print(f"[DEBUG] Decoded bytes field for {filename}: {len(image_bytes)} bytes")
-                            except:
-                                pass
-                    
-                    if image_bytes and len(image_bytes) > 0:
-                        zf.writestr(filename, image_bytes)
-                        added_count += 1
-                        print(f"[DEBUG] Added {filename} to ZIP")
-                    else:
-                        print(f"[DEBUG] Skipped {filename}: no valid image data")
-                        
-                except Exception as e:
-                    print(f"[ERROR] Error adding {item.get('filename', f'image_{idx}')}: {e}")
-                    continue
-        
-        buf.seek(0)
-        zip_data = buf.getvalue()
-        
-        print(f"[DEBUG] Created ZIP: {len(zip_data)} bytes, {added_count} images added")
-        
-        if len(zip_data) <= 100:  # ZIP header is at least 22 bytes, so empty ZIP is very small
-            raise HTTPException(status_code=400, detail=f"Không thể tạo file ZIP (chỉ thêm {added_count}/{len(items)} ảnh)")
+            print(f"[DEBUG] First item blob: {first_item.get('blob')}")
+        
+        # Chỉ gom danh sách (tên file, nguồn); bytes ảnh được đọc dần khi stream
+        entries = []
+        for idx, item in enumerate(items):
+            filename = item.get("filename", f"image_{idx}.jpg")
+            # Sanitize filename
+            filename = filename.replace('/', '_').replace('\\', '_')
+            
+            digest = item.get("blob")
+            if digest and blob_store.exists(digest):
+                entries.append((filename, blob_store.path(digest)))
+                continue
+            
+            # Dữ liệu cũ chưa có trong blob store
+            image_bytes = read_album_image(item)
+            if image_bytes:
+                entries.append((filename, image_bytes))
+            else:
+                print(f"[DEBUG] Skipped {filename}: no valid image data")
+        
+        if not entries:
+            raise HTTPException(status_code=400, detail=f"Không thể tạo file ZIP (chỉ thêm 0/{len(items)} ảnh)")
+        
+        print(f"[DEBUG] Streaming ZIP with {len(entries)}/{len(items)} images")
         
         safe_name = album_name.replace('/', '_').replace('"', '')
         return StreamingResponse(
-            BytesIO(zip_data),
+            stream_zip(entries),
             media_type="application/zip",
             headers={"Content-Disposition": f'attachment; filename="{safe_name}.zip"'}
         )
@@ -1175,6 +1496,44 @@ async def download_album(album_name: str, user_email: str = Depends(verify_token
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Lỗi tải album: {str(e)}")
 
+# ===== Recognition Job Routes =====
+
+def _format_job(job: dict) -> dict:
+    """Thông tin job trả về cho client."""
+    return {
+        "job_id": job["job_id"],
+        "album_name": job["album_name"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str, user_email: str = Depends(verify_token)):
+    """Lấy trạng thái job nhận dạng nền."""
+    job = recognition_queue.get(job_id)
+    if not job or job["user_email"] != user_email:
+        raise HTTPException(status_code=404, detail="Job không tồn tại")
+    return {"success": True, "job": _format_job(job)}
+
+@app.get("/api/jobs")
+async def list_jobs(album_name: Optional[str] = None, user_email: str = Depends(verify_token)):
+    """Danh sách job nhận dạng của user kèm tiến độ."""
+    jobs = recognition_queue.list_jobs(user_email, album_name)
+    progress = {}
+    for job in jobs:
+        progress[job["status"]] = progress.get(job["status"], 0) + 1
+    return {
+        "success": True,
+        "jobs": [_format_job(job) for job in jobs],
+        "total": len(jobs),
+        "progress": progress
+    }
+
 @app.get("/api/albums/debug/{album_name}")
 async def debug_album_storage(album_name: str):
     """Debug endpoint để kiểm tra album storage trực tiếp."""
@@ -1226,9 +1585,8 @@ async def get_albums_stats(user_email: str = Depends(verify_token)):
             if items:
                 first_item = items[0]
                 item_data["first_item_keys"] = list(first_item.keys())
-                item_data["first_item_data_type"] = type(first_item.get("image_data", "N/A")).__name__
-                if "image_data" in first_item:
-                    item_data["image_data_length"] = len(first_item.get("image_data", ""))
+                item_data["first_item_blob"] = first_item.get("blob")
+                item_data["total_size"] = sum(item.get("size", 0) for item in items)
             stats["albums"][album_name] = item_data
         
         print(f"[DEBUG] Album stats: {stats}")
@@ -1899,6 +2257,8 @@ async def get_user_info(username: str, token: str = Depends(verify_token)):
         }
 
 # ===== Social Feed Endpoints =====
+# Ảnh post định danh theo SHA-256 nội dung, URL không bao giờ đổi nội dung
+SOCIAL_IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 @app.post("/api/social/posts")
 async def create_post(
@@ -1920,17 +2280,20 @@ async def create_post(
         if not content and not image:
             raise HTTPException(status_code=400, detail="Please provide content or image")
         
-        image_data = None
+        post_image = None
         if image:
-            # Đọc và encode ảnh thành base64
+            # Lưu ảnh vào blob store (xác định loại ảnh và kích thước từ nội dung)
             image_bytes = await image.read()
-            image_data = f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode()}"
-            print(f"[SOCIAL] Image encoded, size: {len(image_data)} bytes")
+            try:
+                post_image = await run_in_threadpool(store_post_image, image_bytes)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            print(f"[SOCIAL] Image stored: {post_image['blob']}, size: {len(image_bytes)} bytes")
         
         post = social_feed_manager.create_post(
             user_email=user_email,
             content=content or "",
-            image_data=image_data,
+            image=post_image,
             location=location,
             user_avatar=user_avatar,
             user_fullname=user_fullname
@@ -1946,21 +2309,31 @@ async def create_post(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/social/posts")
-async def get_posts(limit: int = 20, offset: int = 0, authorization: str = Header(None)):
-    """Lấy danh sách posts"""
+async def get_posts(limit: int = 20, offset: int = 0, before: Optional[str] = None,
+                    after: Optional[str] = None, authorization: str = Header(None)):
+    """Lấy danh sách posts (phân trang bằng offset hoặc cursor before=/after=)"""
     try:
         # Kiểm tra user đã đăng nhập
         user_email = get_current_user_email(authorization)
         print(f"[SOCIAL] Getting posts for user: {user_email}, limit: {limit}, offset: {offset}")
         
-        posts = social_feed_manager.get_posts(limit=limit, offset=offset)
+        try:
+            page = social_feed_manager.get_posts_page(limit=limit, offset=offset, before=before, after=after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        posts = page["posts"]
         print(f"[SOCIAL] Found {len(posts)} posts")
         
-        # Thêm thông tin liked_by_user
-        for post in posts:
-            post['liked_by_user'] = social_feed_manager.is_liked_by_user(post['post_id'], user_email)
+        # Thêm thông tin liked_by_user (tra một lần cho cả trang)
+        social_feed_manager.with_liked_by_user(posts, user_email)
         
-        return {"success": True, "posts": posts, "total": len(posts)}
+        return {
+            "success": True,
+            "posts": posts,
+            "total": len(posts),
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"]
+        }
     except HTTPException as e:
         print(f"[SOCIAL] HTTP Error getting posts: {e.detail}")
         raise e
@@ -1987,18 +2360,30 @@ async def get_post(post_id: str, authorization: str = Header(None)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/social/users/{email}/posts")
-async def get_user_posts(email: str, limit: int = 20, authorization: str = Header(None)):
-    """Lấy posts của một user"""
+async def get_user_posts(email: str, limit: int = 20, offset: int = 0, before: Optional[str] = None,
+                         after: Optional[str] = None, authorization: str = Header(None)):
+    """Lấy posts của một user (phân trang bằng offset hoặc cursor before=/after=)"""
     try:
         current_user = get_current_user_email(authorization)
         
-        posts = social_feed_manager.get_user_posts(user_email=email, limit=limit)
+        try:
+            page = social_feed_manager.get_user_posts_page(
+                user_email=email, limit=limit, offset=offset, before=before, after=after
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        posts = page["posts"]
         
-        # Thêm thông tin liked_by_user
-        for post in posts:
-            post['liked_by_user'] = social_feed_manager.is_liked_by_user(post['post_id'], current_user)
+        # Thêm thông tin liked_by_user (tra một lần cho cả trang)
+        social_feed_manager.with_liked_by_user(posts, current_user)
         
-        return {"success": True, "posts": posts}
+        return {
+            "success": True,
+            "posts": posts,
+            "total_posts": page["total_posts"],
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"]
+        }
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -2089,6 +2474,47 @@ async def toggle_like(post_id: str, authorization: str = Header(None)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/social/images/{digest}")
+async def get_social_image(digest: str, request: Request, size: Optional[int] = Query(None)):
+    """Serve ảnh của post (có ETag/Range).
+    
+    size: cạnh dài của bản thu nhỏ (128/512/1600), bỏ trống để lấy ảnh gốc.
+    Ảnh định danh theo nội dung nên không đổi, client được cache lâu dài.
+    """
+    try:
+        # Chỉ serve ảnh đang thuộc một post (blob store dùng chung với album)
+        content_type = social_feed_manager.image_content_type(digest)
+        if not content_type or not blob_store.exists(digest):
+            raise HTTPException(status_code=404, detail="Image not found")
+        
+        if size is not None:
+            if size not in VARIANT_SIZES:
+                raise HTTPException(status_code=400, detail=f"size phải là một trong {list(VARIANT_SIZES)}")
+            variant = await run_in_threadpool(variant_cache.get, digest, size)
+            if not variant:
+                raise HTTPException(status_code=404, detail="Image not found")
+            variant_path, variant_type = variant
+            return file_response(
+                request,
+                variant_path,
+                etag=make_etag(f"{digest}-{size}"),
+                media_type=variant_type,
+                cache_control=SOCIAL_IMAGE_CACHE_CONTROL
+            )
+        
+        return file_response(
+            request,
+            blob_store.path(digest),
+            etag=make_etag(digest),
+            media_type=content_type,
+            cache_control=SOCIAL_IMAGE_CACHE_CONTROL
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[SOCIAL] Error serving image: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/social/posts/{post_id}/likes")
 async def get_likes(post_id: str):
     """Lấy danh sách users đã like post"""
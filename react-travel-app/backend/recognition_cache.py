@@ -0,0 +1,210 @@
+"""
+Recognition Cache Module - Cache kết quả nhận dạng theo hash ảnh
+Khóa bằng hash chính xác (SHA-256 của pixel) và perceptual hash (dHash 64 bit),
+ảnh gần giống (khoảng cách Hamming nhỏ) dùng lại kết quả cũ thay vì gọi OpenAI lần nữa.
+Lưu trong SQLite, có TTL, giới hạn số bản ghi và thống kê hit-rate.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, Optional, Set, Tuple
+
+from PIL import Image
+
+# File SQLite chứa cache
+CACHE_DB = "recognition_cache.db"
+# Thời gian sống của một kết quả (giây), mặc định 30 ngày
+CACHE_TTL = int(os.getenv("RECOGNITION_CACHE_TTL", str(30 * 24 * 3600)))
+# Số bản ghi tối đa, vượt quá thì xóa bản ghi ít dùng nhất
+CACHE_MAX_ENTRIES = int(os.getenv("RECOGNITION_CACHE_MAX_ENTRIES", "10000"))
+# Khoảng cách Hamming tối đa giữa 2 dHash để coi là cùng một ảnh
+CACHE_MAX_DISTANCE = int(os.getenv("RECOGNITION_CACHE_MAX_DISTANCE", "5"))
+
+# Chia dHash 64 bit thành 8 band 8 bit: 2 hash cách nhau <= 7 bit chắc chắn trùng ít nhất 1 band
+HASH_BANDS = 8
+BAND_BITS = 64 // HASH_BANDS
+
+
+def image_keys(image_pil: Image.Image) -> Tuple[str, int]:
+    """Tính (hash chính xác, dHash 64 bit) của ảnh."""
+    exact = hashlib.sha256()
+    exact.update(f"{image_pil.mode}:{image_pil.size}".encode("utf-8"))
+    exact.update(image_pil.tobytes())
+
+    # dHash: so sánh độ sáng các pixel kề nhau trên ảnh xám 9x8
+    gray = image_pil.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = list(gray.getdata())
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            dhash = (dhash << 1) | (1 if left > right else 0)
+    return exact.hexdigest(), dhash
+
+
+def _bands(dhash: int):
+    """Các band (vị trí, giá trị) của dHash dùng cho chỉ mục tra gần đúng."""
+    mask = (1 << BAND_BITS) - 1
+    for i in range(HASH_BANDS):
+        yield i, (dhash >> (i * BAND_BITS)) & mask
+
+
+class RecognitionCache:
+    """Cache kết quả nhận dạng ảnh, tra chính xác và gần đúng."""
+
+    def __init__(self, db_path: str = CACHE_DB, ttl: int = CACHE_TTL,
+                 max_entries: int = CACHE_MAX_ENTRIES, max_distance: int = CACHE_MAX_DISTANCE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+
+        self._lock = Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS recognition_cache (
+                namespace TEXT NOT NULL,
+                exact_hash TEXT NOT NULL,
+                dhash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_hit REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (namespace, exact_hash)
+            )
+        """)
+
+        # Chỉ mục trong bộ nhớ cho tra gần đúng: (namespace, band, giá trị) -> {exact_hash}
+        self._band_index: Dict[Tuple[str, int, int], Set[str]] = {}
+        self._dhashes: Dict[Tuple[str, str], int] = {}
+
+        self._stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._purge_expired()
+        self._load_index()
+
+    def _load_index(self):
+        rows = self._conn.execute("SELECT namespace, exact_hash, dhash FROM recognition_cache").fetchall()
+        for namespace, exact_hash, dhash_hex in rows:
+            self._index_add(namespace, exact_hash, int(dhash_hex, 16))
+
+    def _index_add(self, namespace: str, exact_hash: str, dhash: int):
+        self._dhashes[(namespace, exact_hash)] = dhash
+        for band in _bands(dhash):
+            self._band_index.setdefault((namespace, *band), set()).add(exact_hash)
+
+    def _index_remove(self, namespace: str, exact_hash: str):
+        dhash = self._dhashes.pop((namespace, exact_hash), None)
+        if dhash is None:
+            return
+        for band in _bands(dhash):
+            bucket = self._band_index.get((namespace, *band))
+            if bucket:
+                bucket.discard(exact_hash)
+                if not bucket:
+                    del self._band_index[(namespace, *band)]
+
+    def _delete(self, namespace: str, exact_hash: str):
+        self._conn.execute(
+            "DELETE FROM recognition_cache WHERE namespace = ? AND exact_hash = ?",
+            (namespace, exact_hash)
+        )
+        self._index_remove(namespace, exact_hash)
+
+    def _purge_expired(self):
+        self._conn.execute("DELETE FROM recognition_cache WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def _nearest(self, namespace: str, dhash: int) -> Optional[str]:
+        """Tìm exact_hash có dHash gần nhất trong ngưỡng Hamming."""
+        candidates = set()
+        for band in _bands(dhash):
+            candidates |= self._band_index.get((namespace, *band), set())
+
+        best_hash, best_distance = None, self.max_distance + 1
+        for exact_hash in candidates:
+            distance = bin(self._dhashes[(namespace, exact_hash)] ^ dhash).count("1")
+            if distance < best_distance:
+                best_hash, best_distance = exact_hash, distance
+        return best_hash
+
+    def lookup(self, namespace: str, keys: Tuple[str, int]) -> Optional[Dict]:
+        """Tra kết quả đã lưu cho ảnh (chính xác trước, sau đó gần đúng)."""
+        exact_hash, dhash = keys
+        now = time.time()
+        with self._lock:
+            kind = "exact_hits"
+            row = self._conn.execute(
+                "SELECT result, created_at FROM recognition_cache WHERE namespace = ? AND exact_hash = ?",
+                (namespace, exact_hash)
+            ).fetchone()
+            if row is None:
+                kind = "near_hits"
+                near_hash = self._nearest(namespace, dhash)
+                if near_hash:
+                    exact_hash = near_hash
+                    row = self._conn.execute(
+                        "SELECT result, created_at FROM recognition_cache WHERE namespace = ? AND exact_hash = ?",
+                        (namespace, exact_hash)
+                    ).fetchone()
+
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            result, created_at = row
+            if now - created_at > self.ttl:
+                self._delete(namespace, exact_hash)
+                self._stats["misses"] += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE recognition_cache SET last_hit = ?, hits = hits + 1 WHERE namespace = ? AND exact_hash = ?",
+                (now, namespace, exact_hash)
+            )
+            self._stats[kind] += 1
+        return json.loads(result)
+
+    def store(self, namespace: str, keys: Tuple[str, int], result):
+        """Lưu kết quả nhận dạng của ảnh."""
+        exact_hash, dhash = keys
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recognition_cache "
+                "(namespace, exact_hash, dhash, result, created_at, last_hit, hits) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (namespace, exact_hash, f"{dhash:016x}", json.dumps(result, ensure_ascii=False), now, now)
+            )
+            self._index_remove(namespace, exact_hash)
+            self._index_add(namespace, exact_hash, dhash)
+            self._stats["stores"] += 1
+            self._evict()
+
+    def _evict(self):
+        """Xóa các bản ghi ít được dùng nhất khi vượt quá max_entries."""
+        overflow = len(self._dhashes) - self.max_entries
+        if overflow <= 0:
+            return
+        rows = self._conn.execute(
+            "SELECT namespace, exact_hash FROM recognition_cache ORDER BY last_hit LIMIT ?",
+            (overflow,)
+        ).fetchall()
+        for namespace, exact_hash in rows:
+            self._delete(namespace, exact_hash)
+        self._stats["evictions"] += len(rows)
+
+    def stats(self) -> Dict:
+        """Thống kê cache: số lần hit/miss, hit-rate, số bản ghi."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._dhashes)
+        lookups = stats["exact_hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["exact_hits"] + stats["near_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+# Global instance
+recognition_cache = RecognitionCache()
@@ -0,0 +1,218 @@
+"""
+Recognition Jobs Module - Hàng đợi nhận dạng địa danh chạy nền
+Job được lưu trong SQLite nên không mất khi server khởi động lại; một nhóm worker thread
+lấy job theo thứ tự, gọi hàm xử lý và ghi lại kết quả/trạng thái.
+"""
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+from threading import Condition, Event, Lock, Thread
+from typing import Callable, Dict, List, Optional
+
+# File SQLite chứa hàng đợi
+JOBS_DB = "recognition_jobs.db"
+# Số worker thread xử lý job
+JOB_WORKERS = int(os.getenv("RECOGNITION_WORKERS", "2"))
+# Số lần thử tối đa cho một job trước khi đánh dấu failed
+JOB_MAX_ATTEMPTS = 3
+# Thời gian chờ trước lần thử lại đầu tiên (giây), nhân đôi sau mỗi lần thất bại
+JOB_RETRY_BACKOFF = float(os.getenv("RECOGNITION_RETRY_BACKOFF", "5"))
+
+# Job đã ghi nhưng chờ item được lưu vào album (release) mới được xử lý
+STATUS_HELD = "held"
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class RecognitionJobQueue:
+    """Hàng đợi job bền vững (SQLite) với worker pool cục bộ."""
+
+    def __init__(self, db_path: str = JOBS_DB, workers: int = JOB_WORKERS):
+        self.db_path = db_path
+        self.workers = workers
+
+        # Một connection dùng chung, mọi truy cập đều qua self._lock
+        self._lock = Lock()
+        self._has_work = Condition(self._lock)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                user_email TEXT NOT NULL,
+                album_name TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                blob TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        # File hàng đợi tạo trước khi có backoff
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "available_at" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN available_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_email, album_name)")
+
+        self._handler: Optional[Callable[[Dict], Dict]] = None
+        self._on_failed: Optional[Callable[[Dict, str], None]] = None
+        self._threads: List[Thread] = []
+        self._stop = Event()
+
+    @staticmethod
+    def new_job_id() -> str:
+        """Tạo id cho job mới."""
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        return job
+
+    def enqueue(self, job_id: str, user_email: str, album_name: str, filename: str, blob: str,
+                held: bool = False) -> str:
+        """
+        Thêm job nhận dạng cho một ảnh trong album.
+
+        held=True: job được ghi bền vững nhưng chỉ chạy sau release() (hoặc lần start() sau
+        nếu server dừng trước đó), dùng khi job phải được ghi trước item trong album.
+        """
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, user_email, album_name, filename, blob, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_email, album_name, filename, blob, STATUS_HELD if held else STATUS_PENDING, now, now)
+            )
+            if not held:
+                self._has_work.notify()
+        return job_id
+
+    def release(self, job_ids: List[str]):
+        """Cho phép worker xử lý các job đang held."""
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+                [(STATUS_PENDING, datetime.now().isoformat(), job_id, STATUS_HELD) for job_id in job_ids]
+            )
+            self._has_work.notify_all()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Lấy thông tin job theo id."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, user_email: str, album_name: Optional[str] = None) -> List[Dict]:
+        """Danh sách job của user (có thể lọc theo album), mới nhất trước."""
+        query = "SELECT * FROM jobs WHERE user_email = ?"
+        params = [user_email]
+        if album_name is not None:
+            query += " AND album_name = ?"
+            params.append(album_name)
+        query += " ORDER BY created_at DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def start(self, handler: Callable[[Dict], Dict], on_failed: Optional[Callable[[Dict, str], None]] = None):
+        """Khởi động worker pool. Job đang chạy dở hoặc còn held khi server tắt được đưa lại hàng đợi."""
+        if self._threads:
+            return
+        self._handler = handler
+        self._on_failed = on_failed
+        self._stop.clear()
+
+        with self._lock:
+            # Job held còn sót: item có thể đã được lưu; nếu chưa, worker chỉ không tìm thấy item
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status IN (?, ?)",
+                (STATUS_PENDING, datetime.now().isoformat(), STATUS_RUNNING, STATUS_HELD)
+            )
+            if cursor.rowcount:
+                print(f"[JOBS] Re-queued {cursor.rowcount} interrupted job(s)")
+
+        for i in range(self.workers):
+            thread = Thread(target=self._worker, name=f"recognition-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[JOBS] Started {self.workers} recognition worker(s)")
+
+    def stop(self, timeout: float = 5.0):
+        """Dừng worker pool (job đang chạy sẽ được chạy lại ở lần start sau)."""
+        self._stop.set()
+        with self._lock:
+            self._has_work.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _claim(self) -> Optional[Dict]:
+        """Lấy job pending cũ nhất đã hết thời gian chờ và chuyển sang running (gọi khi đang giữ lock)."""
+        row = self._conn.execute(
+            "SELECT * FROM jobs WHERE status = ? AND available_at <= ? ORDER BY created_at LIMIT 1",
+            (STATUS_PENDING, time.time())
+        ).fetchone()
+        if not row:
+            return None
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+            (STATUS_RUNNING, datetime.now().isoformat(), row["job_id"])
+        )
+        job = self._row_to_job(row)
+        job["attempts"] += 1
+        return job
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None,
+                retry_in: float = 0.0):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, available_at = ?, updated_at = ? WHERE job_id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, time.time() + retry_in, datetime.now().isoformat(), job_id)
+            )
+
+    def _worker(self):
+        while not self._stop.is_set():
+            with self._lock:
+                job = self._claim()
+                if job is None:
+                    self._has_work.wait(timeout=1.0)
+                    continue
+
+            try:
+                result = self._handler(job)
+                self._finish(job["job_id"], STATUS_DONE, result=result)
+            except Exception as e:
+                error = str(e)[:200]
+                if job["attempts"] < JOB_MAX_ATTEMPTS:
+                    retry_in = JOB_RETRY_BACKOFF * 2 ** (job["attempts"] - 1)
+                    print(f"[JOBS] Job {job['job_id']} failed (attempt {job['attempts']}), retrying in {retry_in:g}s: {error}")
+                    self._finish(job["job_id"], STATUS_PENDING, error=error, retry_in=retry_in)
+                else:
+                    print(f"[JOBS] Job {job['job_id']} failed permanently: {error}")
+                    self._finish(job["job_id"], STATUS_FAILED, error=error)
+                    if self._on_failed:
+                        try:
+                            self._on_failed(job, error)
+                        except Exception as callback_error:
+                            print(f"[JOBS] on_failed callback error: {callback_error}")
+
+
+# Global instance
+recognition_queue = RecognitionJobQueue()
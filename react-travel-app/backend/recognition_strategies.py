@@ -0,0 +1,221 @@
+"""
+Recognition Strategies Module - Thử nhiều biến thể ảnh để nhận dạng địa danh khó
+Mỗi biến thể (ảnh gốc, thu nhỏ, cắt giữa, tăng nét/tương phản/sáng...) là một strategy,
+áp dụng lên ảnh đã chuẩn hóa cho vision (cạnh dài <= VISION_MAX_EDGE) nên mỗi biến thể
+gửi đi một payload khác nhau.
+Các strategy chạy song song trong giới hạn số lời gọi và thời gian; kết quả hợp lệ
+đầu tiên thắng, các strategy còn lại bị hủy. Thứ tự thử được học từ tỷ lệ thành công
+trước đó (lưu trong file JSON).
+"""
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Event, Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageEnhance, ImageFilter
+
+from atomic_file import replace_file
+
+# File lưu thống kê thành công của từng strategy
+STRATEGY_STATS_FILE = "strategy_stats.json"
+# Số lời gọi vision tối đa cho một ảnh
+STRATEGY_MAX_CALLS = int(os.getenv("STRATEGY_MAX_CALLS", "12"))
+# Thời gian tối đa cho một ảnh (giây)
+STRATEGY_MAX_SECONDS = float(os.getenv("STRATEGY_MAX_SECONDS", "60"))
+# Số lời gọi chạy song song
+STRATEGY_PARALLELISM = int(os.getenv("STRATEGY_PARALLELISM", "3"))
+
+
+def _scale(factor: float):
+    def transform(img: Image.Image) -> Image.Image:
+        w, h = img.size
+        return img.resize((max(1, int(w * factor)), max(1, int(h * factor))), Image.Resampling.LANCZOS)
+    return transform
+
+
+def _center_crop(fraction: float):
+    """Cắt vùng giữa ảnh (phóng to chủ thể mà không vượt giới hạn kích thước)."""
+    def transform(img: Image.Image) -> Image.Image:
+        w, h = img.size
+        cw, ch = max(1, int(w * fraction)), max(1, int(h * fraction))
+        left, top = (w - cw) // 2, (h - ch) // 2
+        return img.crop((left, top, left + cw, top + ch))
+    return transform
+
+
+def _combo(img: Image.Image) -> Image.Image:
+    img = ImageEnhance.Sharpness(img).enhance(1.8)
+    return ImageEnhance.Contrast(img).enhance(1.3)
+
+
+# (tên, hàm biến đổi) theo thứ tự mặc định khi chưa có thống kê.
+# Không phóng to: ảnh gửi đi bị giới hạn cạnh dài nên bản phóng to trùng với ảnh gốc.
+STRATEGIES: List[Tuple[str, Callable[[Image.Image], Image.Image]]] = [
+    ("original", lambda img: img),
+    ("center_crop_0.7", _center_crop(0.7)),
+    ("scale_0.75", _scale(0.75)),
+    ("scale_0.5", _scale(0.5)),
+    ("sharpness", lambda img: ImageEnhance.Sharpness(img).enhance(2.0)),
+    ("contrast", lambda img: ImageEnhance.Contrast(img).enhance(1.5)),
+    ("brightness", lambda img: ImageEnhance.Brightness(img).enhance(1.3)),
+    ("sharpen_filter", lambda img: img.filter(ImageFilter.SHARPEN)),
+    ("center_crop_0.5", _center_crop(0.5)),
+    ("sharpness_contrast", _combo),
+]
+
+
+class StrategyEngine:
+    """Chạy các strategy nhận dạng song song theo ngân sách, học thứ tự từ thống kê."""
+
+    def __init__(self, stats_file: str = STRATEGY_STATS_FILE, parallelism: int = STRATEGY_PARALLELISM):
+        self.stats_file = stats_file
+        self.parallelism = parallelism
+        self._executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="strategy")
+        self._lock = Lock()
+        # name -> {"attempts", "successes", "total_seconds"}
+        self._stats: Dict[str, Dict] = self._load_stats()
+
+    def _load_stats(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.stats_file):
+            return {}
+        try:
+            with open(self.stats_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[STRATEGY] Could not load stats: {e}")
+            return {}
+
+    def _save_stats(self):
+        """Ghi thống kê (file tạm + rename), gọi khi đang giữ lock."""
+        directory = os.path.dirname(os.path.abspath(self.stats_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._stats, f, ensure_ascii=False, indent=2)
+            replace_file(tmp_path, self.stats_file)
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"[STRATEGY] Could not save stats: {e}")
+
+    def _record(self, name: str, success: bool, seconds: float):
+        with self._lock:
+            entry = self._stats.setdefault(name, {"attempts": 0, "successes": 0, "total_seconds": 0.0})
+            entry["attempts"] += 1
+            entry["successes"] += 1 if success else 0
+            entry["total_seconds"] = round(entry["total_seconds"] + seconds, 3)
+            self._save_stats()
+
+    def _success_rate(self, name: str) -> float:
+        """Tỷ lệ thành công đã làm trơn (Laplace), strategy chưa thử có 0.5."""
+        entry = self._stats.get(name, {})
+        return (entry.get("successes", 0) + 1) / (entry.get("attempts", 0) + 2)
+
+    def ordered_strategies(self) -> List[Tuple[str, Callable]]:
+        """Strategy sắp theo tỷ lệ thành công giảm dần (bằng nhau giữ thứ tự mặc định)."""
+        with self._lock:
+            return sorted(STRATEGIES, key=lambda s: -self._success_rate(s[0]))
+
+    def stats(self) -> List[Dict]:
+        """Thống kê từng strategy theo thứ tự sẽ thử."""
+        ordered = self.ordered_strategies()
+        with self._lock:
+            result = []
+            for name, _ in ordered:
+                entry = self._stats.get(name, {"attempts": 0, "successes": 0, "total_seconds": 0.0})
+                attempts = entry["attempts"]
+                result.append({
+                    "strategy": name,
+                    "attempts": attempts,
+                    "successes": entry["successes"],
+                    "success_rate": round(self._success_rate(name), 4),
+                    "avg_seconds": round(entry["total_seconds"] / attempts, 3) if attempts else None
+                })
+        return result
+
+    def run(self, image: Image.Image, ask: Callable[[Image.Image], str], is_valid: Callable[[str], bool],
+            retries: int = 1, max_calls: int = STRATEGY_MAX_CALLS,
+            max_seconds: float = STRATEGY_MAX_SECONDS) -> Optional[Tuple[str, str]]:
+        """
+        Thử các strategy cho đến khi có kết quả hợp lệ hoặc hết ngân sách.
+
+        Args:
+            image: Ảnh gốc
+            ask: Hàm gọi vision, trả về tên địa danh
+            is_valid: Hàm kiểm tra kết quả hợp lệ
+            retries: Số lần thử mỗi strategy
+            max_calls: Số lời gọi ask tối đa
+            max_seconds: Thời gian tối đa (giây)
+
+        Returns:
+            (tên địa danh, tên strategy) hoặc None nếu không nhận dạng được
+        """
+        # Vòng 1 thử mỗi strategy một lần, các vòng sau mới thử lại
+        ordered = self.ordered_strategies()
+        plan = [name_fn for _ in range(max(1, retries)) for name_fn in ordered][:max_calls]
+        deadline = time.monotonic() + max_seconds
+        stop = Event()
+        variants: Dict[str, Image.Image] = {}
+        variants_lock = Lock()
+
+        def attempt(name: str, transform: Callable) -> Optional[str]:
+            if stop.is_set():
+                return None
+            try:
+                with variants_lock:
+                    variant = variants.get(name)
+                if variant is None:
+                    variant = transform(image)
+                    with variants_lock:
+                        variants.setdefault(name, variant)
+            except Exception as e:
+                print(f"[STRATEGY] Variant {name} failed: {e}")
+                return None
+            if stop.is_set():
+                return None
+            started = time.monotonic()
+            try:
+                result = ask(variant)
+            except Exception as e:
+                print(f"[STRATEGY] {name} call failed: {e}")
+                result = ""
+            success = is_valid(result)
+            self._record(name, success, time.monotonic() - started)
+            return result if success else None
+
+        pending = {}
+        next_index = 0
+        try:
+            while next_index < len(plan) or pending:
+                # Giữ tối đa parallelism lời gọi đang chạy
+                while next_index < len(plan) and len(pending) < self.parallelism:
+                    name, transform = plan[next_index]
+                    pending[self._executor.submit(attempt, name, transform)] = name
+                    next_index += 1
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"[STRATEGY] Time budget exhausted ({max_seconds}s)")
+                    return None
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    result = future.result()
+                    if result:
+                        print(f"[STRATEGY] ✅ Found with {name}: {result}")
+                        return result, name
+            print(f"[STRATEGY] Call budget exhausted ({len(plan)} calls)")
+            return None
+        finally:
+            # Hủy các strategy chưa chạy; lời gọi đang chạy bỏ qua kết quả
+            stop.set()
+            for future in pending:
+                future.cancel()
+
+
+# Global instance
+strategy_engine = StrategyEngine()
@@ -1,16 +1,27 @@
 import base64
 import io
+import json
+import math
 import os
+import re
 import exifread
-from geopy.geocoders import Nominatim
-from PIL import Image
+import unidecode
+from PIL import Image, ImageOps
 from io import BytesIO
 from dotenv import load_dotenv
 from openai import OpenAI
+from recognition_cache import recognition_cache, image_keys
+from geocoding import geocoder
+from database_file import database_file
+from geo import GeoGridIndex
+from recognition_strategies import strategy_engine
 
 # Load environment variables
 load_dotenv()
 
+# Thời gian chờ tối đa cho mỗi lời gọi OpenAI Vision (giây)
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '30'))
+
 # Sử dụng OpenAI API
 print("[RECOGNIZE] Initializing OpenAI API for image recognition...")
 api_key = os.getenv('OPENAI_API_KEY', '')
@@ -20,7 +31,7 @@ if not api_key:
     USE_LOCAL_MODEL = False
 else:
     try:
-        client = OpenAI(api_key=api_key)
+        client = OpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=1)
         OPENAI_ENABLED = True
         USE_LOCAL_MODEL = False
         print("[RECOGNIZE] ✅ OpenAI API initialized successfully")
@@ -29,83 +40,285 @@ else:
         OPENAI_ENABLED = False
         USE_LOCAL_MODEL = False
 
+# Cạnh dài tối đa của ảnh gửi lên vision API (px)
+VISION_MAX_EDGE = int(os.getenv('VISION_MAX_EDGE', '1024'))
+# Dung lượng JPEG mục tiêu; giảm quality dần cho đến khi đạt (bytes)
+VISION_TARGET_BYTES = int(os.getenv('VISION_TARGET_BYTES', str(250 * 1024)))
+VISION_QUALITY_STEPS = (85, 75, 65, 55)
+
+def prepare_image_for_vision(image_pil):
+    """Chuẩn hóa ảnh trước khi gửi: xoay theo EXIF, chuyển RGB, giới hạn cạnh dài."""
+    img = ImageOps.exif_transpose(image_pil)
+    
+    # Ảnh có kênh alpha (RGBA, LA, P trong suốt): ghép lên nền trắng
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    
+    width, height = img.size
+    ratio = min(VISION_MAX_EDGE / width, VISION_MAX_EDGE / height, 1.0)
+    if ratio < 1.0:
+        img = img.resize((max(1, int(width * ratio)), max(1, int(height * ratio))), Image.Resampling.LANCZOS)
+    return img
+
 def encode_image_base64(image_pil):
-    """Chuyển đổi PIL Image sang base64 string."""
-    buffered = BytesIO()
-    image_pil.save(buffered, format="JPEG")
-    img_bytes = buffered.getvalue()
-    return base64.b64encode(img_bytes).decode('utf-8')
+    """Chuyển đổi PIL Image sang base64 JPEG đã chuẩn hóa (kết quả được ghi nhớ trên ảnh)."""
+    # PIL Image không hash được nên ghi nhớ payload ngay trên object
+    memo = getattr(image_pil, "_vision_payload", None)
+    if memo and memo[0] == (image_pil.mode, image_pil.size):
+        return memo[1]
+    
+    img = prepare_image_for_vision(image_pil)
+    img_bytes = b""
+    for quality in VISION_QUALITY_STEPS:
+        buffered = BytesIO()
+        img.save(buffered, format="JPEG", quality=quality, optimize=True)
+        img_bytes = buffered.getvalue()
+        if len(img_bytes) <= VISION_TARGET_BYTES:
+            break
+    
+    payload = base64.b64encode(img_bytes).decode('utf-8')
+    image_pil._vision_payload = ((image_pil.mode, image_pil.size), payload)
+    return payload
 
-def load_landmarks_database():
-    """Load danh sách địa danh từ database.json."""
-    try:
-        import json
-        import unidecode
-        with open("database.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        # Tạo dictionary để tra cứu nhanh
-        landmarks_dict = {}
+def normalize_landmark_name(name):
+    """Chuẩn hóa tên địa danh: chữ thường, bỏ dấu tiếng Việt."""
+    return unidecode.unidecode(name.lower()).strip()
+
+# Bán kính tối đa (mét) để coi ảnh có GPS là chụp tại một địa danh
+GPS_MATCH_RADIUS_M = float(os.getenv("GPS_MATCH_RADIUS_M", "300"))
+
+# Điểm tương đồng tối thiểu để chấp nhận kết quả tra mờ, thấp hơn thì dùng geocoding
+FUZZY_MATCH_THRESHOLD = float(os.getenv("LANDMARK_MATCH_THRESHOLD", "0.6"))
+# Độ giống (Dice trigram) tối thiểu để một từ sai chính tả được tính là khớp
+TOKEN_MATCH_MIN_SIMILARITY = 0.5
+
+def _name_tokens(normalized_name):
+    """Tách tên đã chuẩn hóa thành các từ."""
+    return re.findall(r"[a-z0-9]+", normalized_name)
+
+def _name_trigrams(tokens):
+    """Tập trigram ký tự của các từ (mỗi từ được đệm khoảng trắng như pg_trgm)."""
+    trigrams = set()
+    for token in tokens:
+        padded = f"  {token} "
+        for i in range(len(padded) - 2):
+            trigrams.add(padded[i:i + 3])
+    return trigrams
+
+class LandmarkRegistry:
+    """
+    Danh sách địa danh từ database.json (loader dùng chung database_file),
+    dựng lại khi file được load lại.
+    
+    Giữ sẵn: dict tên chuẩn hóa -> thông tin, danh sách tên cho prompt,
+    và chỉ mục trigram -> tên để tra mờ (chấm điểm, chọn kết quả tốt nhất).
+    """
+    
+    def __init__(self, source=database_file):
+        self.source = source
+    
+    @staticmethod
+    def _build(data, version=None):
+        """Tạo toàn bộ chỉ mục từ dữ liệu database.json."""
+        landmarks = {}
+        tokens = {}
+        trigrams = {}
+        trigram_index = {}
+        token_index = {}
+        names = []
         for item in data:
             name = item.get("name", "")
+            if not name:
+                continue
+            names.append(name)
             # Normalize tên để dễ so sánh
-            normalized_name = unidecode.unidecode(name.lower())
-            landmarks_dict[normalized_name] = {
+            normalized_name = normalize_landmark_name(name)
+            landmarks[normalized_name] = {
                 "name": name,
                 "lat": item.get("lat"),
                 "lon": item.get("lon"),
                 "location": item.get("location"),
-                "province": item.get("province")
+                "province": item.get("province"),
+                "introduction": item.get("introduction")
             }
-        return landmarks_dict
-    except Exception as e:
-        print(f"[RECOGNIZE] Warning: Could not load database.json: {e}")
-        return {}
-
-def find_landmark_info(landmark_name):
-    """Tìm thông tin địa danh từ database hoặc geocoding."""
-    import unidecode
+            tokens[normalized_name] = set(_name_tokens(normalized_name))
+            for token in tokens[normalized_name]:
+                token_index.setdefault(token, set()).add(normalized_name)
+            trigrams[normalized_name] = _name_trigrams(tokens[normalized_name])
+            for trigram in trigrams[normalized_name]:
+                trigram_index.setdefault(trigram, []).append(normalized_name)
+        
+        # Độ đặc trưng của từ (IDF theo số tên chứa từ): "cho", "cong vien" thấp, "bitexco" cao
+        count = len(landmarks)
+        token_weights = {token: math.log((count + 1) / (len(keys) + 0.5)) for token, keys in token_index.items()}
+        
+        return {
+            "landmarks": landmarks,
+            "tokens": tokens,
+            "trigrams": trigrams,
+            "trigram_index": trigram_index,
+            "token_index": token_index,
+            "token_weights": token_weights,
+            # Trọng số của từ không có trong tên nào (đặc trưng nhất)
+            "unknown_token_weight": math.log((count + 1) / 0.5),
+            "names": names,
+            # Chỉ mục không gian để tìm địa danh gần tọa độ GPS
+            "spatial_index": GeoGridIndex(
+                (info["lat"], info["lon"], info) for info in landmarks.values()
+            ),
+            "prompt_comma_list": ", ".join(names[:34]),
+            "prompt_bullet_list": "\n- ".join(names[:30])
+        }
+    
+    def state(self):
+        """Trạng thái hiện tại (đã load lại nếu file đổi)."""
+        return self.source.view("landmark_registry", self._build)
+    
+    @property
+    def landmarks(self):
+        return self.state()["landmarks"]
+    
+    def prompt_comma_list(self):
+        """Danh sách tên địa danh cho prompt, cách nhau bởi dấu phẩy."""
+        return self.state()["prompt_comma_list"]
+    
+    def prompt_bullet_list(self):
+        """Danh sách tên địa danh cho prompt, mỗi tên một dòng."""
+        return self.state()["prompt_bullet_list"]
+    
+    def nearest(self, lat, lon, max_meters=GPS_MATCH_RADIUS_M):
+        """
+        Địa danh gần tọa độ nhất trong phạm vi max_meters.
+        
+        Returns:
+            (thông tin địa danh, khoảng cách mét) hoặc (None, None)
+        """
+        found = self.state()["spatial_index"].nearest(lat, lon, max_meters / 1000.0)
+        if not found:
+            return None, None
+        distance_km, info = found
+        return info, round(distance_km * 1000.0, 1)
     
-    # Load database
-    landmarks_db = load_landmarks_database()
+    @staticmethod
+    def _token_similarity(token, key_tokens):
+        """Độ giống của từ với từ gần nhất trong tên (1.0 nếu trùng, 0 nếu dưới ngưỡng)."""
+        if token in key_tokens:
+            return 1.0
+        token_trigrams = _name_trigrams([token])
+        best = 0.0
+        for key_token in key_tokens:
+            key_trigrams = _name_trigrams([key_token])
+            best = max(best, 2.0 * len(token_trigrams & key_trigrams) / (len(token_trigrams) + len(key_trigrams)))
+        return best if best >= TOKEN_MATCH_MIN_SIMILARITY else 0.0
     
-    # Normalize tên để tìm kiếm
-    normalized_search = unidecode.unidecode(landmark_name.lower())
+    def resolve(self, landmark_name):
+        """
+        Tìm địa danh khớp nhất với tên (tra mờ theo trigram).
+        
+        - Tên nằm trọn trong truy vấn: điểm = max(Dice trigram, 0.9).
+        - Ngược lại: max(Dice, 0.9) x tỷ lệ trọng số (IDF) các từ của truy vấn có trong tên,
+          nên từ đặc trưng không khớp ("Tân Định", "72") kéo điểm xuống; chia thêm cho số tên
+          cùng chứa các từ trùng (chỉ khớp "Chợ", "Công viên" là mơ hồ).
+        Khớp chính xác = 1.0. Các tên cùng điểm được xếp theo Dice (tên sát hơn thắng).
+        
+        Returns:
+            (thông tin địa danh, điểm 0..1) hoặc (None, 0.0)
+        """
+        state = self.state()
+        landmarks = state["landmarks"]
+        normalized_search = normalize_landmark_name(landmark_name)
+        if not normalized_search:
+            return None, 0.0
+        
+        # Tìm kiếm exact match
+        if normalized_search in landmarks:
+            return landmarks[normalized_search], 1.0
+        
+        query_tokens = set(_name_tokens(normalized_search))
+        query_trigrams = _name_trigrams(query_tokens)
+        if not query_trigrams:
+            return None, 0.0
+        
+        # Đếm số trigram chung với từng ứng viên qua chỉ mục
+        shared = {}
+        for trigram in query_trigrams:
+            for key in state["trigram_index"].get(trigram, ()):
+                shared[key] = shared.get(key, 0) + 1
+        
+        weights = {
+            token: state["token_weights"].get(token, state["unknown_token_weight"]) for token in query_tokens
+        }
+        total_weight = sum(weights.values())
+        
+        best_key, best_rank = None, (0.0, 0.0)
+        for key, count in shared.items():
+            dice = 2.0 * count / (len(query_trigrams) + len(state["trigrams"][key]))
+            key_tokens = state["tokens"][key]
+            common = query_tokens & key_tokens
+            if key_tokens and common == key_tokens:
+                # Tên nằm trọn trong truy vấn (vd: "Nhà thờ Đức Bà Sài Gòn")
+                score = max(dice, 0.9)
+            else:
+                # Phần trọng số của truy vấn có trong tên (từ sai chính tả tính theo độ giống)
+                matched = sum(weight * self._token_similarity(token, key_tokens) for token, weight in weights.items())
+                score = max(dice, 0.9) * matched / total_weight
+                if common:
+                    # Số tên cùng chứa mọi từ trùng: "Vincom" chỉ có 1 tên, "Chợ" có nhiều
+                    holders = set.intersection(*(state["token_index"][token] for token in common))
+                    score /= len(holders)
+            rank = (score, dice)
+            if rank > best_rank:
+                best_key, best_rank = key, rank
+        
+        if best_key is None:
+            return None, 0.0
+        return landmarks[best_key], round(best_rank[0], 4)
     
-    # Tìm kiếm exact match
-    if normalized_search in landmarks_db:
-        info = landmarks_db[normalized_search]
-        address = f"{info['location']}, {info['province']}" if info.get('location') and info.get('province') else info.get('location', 'N/A')
+    def lookup(self, landmark_name, threshold=FUZZY_MATCH_THRESHOLD):
+        """Tìm địa danh theo tên, None nếu điểm khớp thấp hơn ngưỡng."""
+        info, score = self.resolve(landmark_name)
+        return info if score >= threshold else None
+
+landmark_registry = LandmarkRegistry()
+
+def load_landmarks_database():
+    """Load danh sách địa danh từ database.json (dùng registry đã load sẵn)."""
+    return landmark_registry.landmarks
+
+def _landmark_address(info):
+    """Địa chỉ hiển thị của địa danh trong database."""
+    if info.get('location') and info.get('province'):
+        return f"{info['location']}, {info['province']}"
+    return info.get('location', 'N/A')
+
+def find_landmark_info(landmark_name):
+    """Tìm thông tin địa danh từ database (tra mờ) hoặc geocoding."""
+    info, score = landmark_registry.resolve(landmark_name)
+    if info and score >= FUZZY_MATCH_THRESHOLD:
+        print(f"[RECOGNIZE] Matched '{landmark_name}' -> '{info['name']}' (score={score})")
+        address = _landmark_address(info)
         return {
             "lat": info.get("lat"),
             "lon": info.get("lon"),
-            "address": address
+            "address": address,
+            "matched_name": info["name"],
+            "match_score": score
         }
     
-    # Tìm kiếm partial match
-    for key, info in landmarks_db.items():
-        if normalized_search in key or key in normalized_search:
-            address = f"{info['location']}, {info['province']}" if info.get('location') and info.get('province') else info.get('location', 'N/A')
-            return {
-                "lat": info.get("lat"),
-                "lon": info.get("lon"),
-                "address": address
-            }
-    
-    # Nếu không tìm thấy trong database, thử geocoding
+    # Điểm khớp quá thấp: không có trong database, thử geocoding (có cache)
     try:
-        from geopy.geocoders import Nominatim
-        geolocator = Nominatim(user_agent="travel_app_recognizer", timeout=5)
-        
         # Thêm "Vietnam" để tìm kiếm chính xác hơn
-        search_query = f"{landmark_name}, Vietnam"
-        location = geolocator.geocode(search_query, language="vi")
-        
+        location = geocoder.geocode(f"{landmark_name}, Vietnam")
         if location:
             return {
-                "lat": location.latitude,
-                "lon": location.longitude,
-                "address": location.address
+                "lat": location["lat"],
+                "lon": location["lon"],
+                "address": location["address"]
             }
     except Exception as e:
         print(f"[RECOGNIZE] Geocoding error: {e}")
@@ -155,17 +368,14 @@ def get_landmark_from_image(image_pil):
     if not OPENAI_ENABLED:
         return "Không thể nhận diện (OpenAI API chưa sẵn sàng)"
     
-    # Load danh sách địa danh từ database để tham khảo
-    landmark_names = []
-    try:
-        import json
-        with open("database.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            landmark_names = [item.get("name", "") for item in data if item.get("name")]
-    except:
-        pass
-    
-    landmarks_list = ", ".join(landmark_names[:34]) if landmark_names else "Landmark 81, Nhà thờ Đức Bà, Bưu điện Trung tâm Sài Gòn, Chợ Bến Thành, Bitexco Tower, AEON Mall Tân Phú, Vincom Center Đồng Khởi, Bến Nhà Rồng, Crescent Mall, Công viên Suối Tiên"
+    # Ảnh giống hệt/gần giống đã nhận dạng trước đó: dùng lại kết quả
+    cache_keys = image_keys(image_pil)
+    cached = recognition_cache.lookup("landmark_name", cache_keys)
+    if cached:
+        return cached["landmark"]
+    
+    # Danh sách địa danh tham khảo (đã tạo sẵn trong registry)
+    landmarks_list = landmark_registry.prompt_comma_list() or "Landmark 81, Nhà thờ Đức Bà, Bưu điện Trung tâm Sài Gòn, Chợ Bến Thành, Bitexco Tower, AEON Mall Tân Phú, Vincom Center Đồng Khởi, Bến Nhà Rồng, Crescent Mall, Công viên Suối Tiên"
     prompt = f"""Phân tích ảnh này và nhận dạng địa danh cụ thể ở TP. Hồ Chí Minh.
 
 HƯỚNG DẪN QUAN TRỌNG:
@@ -184,8 +394,10 @@ HÃY TRẢ VỀ:
 Chỉ trả về TÊN, không giải thích thêm."""
     
     try:
-        result = get_image_analysis(image_pil, prompt)
-        return result.strip()
+        result = get_image_analysis(image_pil, prompt).strip()
+        if result and "không rõ" not in result.lower():
+            recognition_cache.store("landmark_name", cache_keys, {"landmark": result})
+        return result
     except Exception as e:
         return f"Lỗi nhận dạng: {str(e)[:50]}"
 
@@ -198,17 +410,15 @@ def get_landmark_with_confidence(image_pil):
             "confidence": "low"
         }
     
-    # Load danh sách địa danh từ database
-    landmark_names = []
-    try:
-        import json
-        with open("database.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            landmark_names = [item.get("name", "") for item in data if item.get("name")]
-    except:
-        pass
+    # Ảnh giống hệt/gần giống đã nhận dạng trước đó: dùng lại kết quả
+    cache_keys = image_keys(image_pil)
+    cached = recognition_cache.lookup("landmark_confidence", cache_keys)
+    if cached:
+        print(f"[RECOGNIZE] Cache hit: {cached.get('landmark')}")
+        return cached
     
-    landmarks_list = "\n- ".join(landmark_names[:30]) if landmark_names else "Landmark 81\n- Nhà Thờ Đức Bà\n- Chợ Bến Thành\n- AEON Mall Tân Phú\n- Bitexco Tower"
+    # Danh sách địa danh tham khảo (đã tạo sẵn trong registry)
+    landmarks_list = landmark_registry.prompt_bullet_list() or "Landmark 81\n- Nhà Thờ Đức Bà\n- Chợ Bến Thành\n- AEON Mall Tân Phú\n- Bitexco Tower"
     
     prompt = f"""Phân tích ảnh này và trả về ONLY valid JSON (không có text khác):
 {{
@@ -237,9 +447,6 @@ CHỈ TRẢ VỀ JSON HỢP LỆ, KHÔNG CÓ TEXT NÀO KHÁC."""
     try:
         result = get_image_analysis(image_pil, prompt)
         # Parse JSON response
-        import json
-        import re
-        
         # Try to extract JSON from response if it contains extra text
         # Look for JSON pattern with support for nested objects
         json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', result, re.DOTALL)
@@ -259,6 +466,8 @@ CHỈ TRẢ VỀ JSON HỢP LỆ, KHÔNG CÓ TEXT NÀO KHÁC."""
             data["lon"] = location_info.get("lon")
             data["address"] = location_info.get("address")
             print(f"[RECOGNIZE] Found: lat={data['lat']}, lon={data['lon']}, address={data['address']}")
+            # Chỉ cache kết quả nhận dạng được, ảnh "không rõ" sẽ được thử lại lần sau
+            recognition_cache.store("landmark_confidence", cache_keys, data)
         else:
             data["lat"] = None
             data["lon"] = None
@@ -282,14 +491,14 @@ CHỈ TRẢ VỀ JSON HỢP LỆ, KHÔNG CÓ TEXT NÀO KHÁC."""
             "confidence": "low",
             "lat": None,
             "lon": None,
-            "address": None
+            "address": None,
+            # Lỗi gọi API (có thể thử lại), khác với ảnh không nhận ra địa danh
+            "error": str(e)
         }
 
 
-def detect_landmark_strict(pil_img, retries=3):
-    """Nhận dạng địa danh với độ chính xác cao - thử nhiều lần với các biến thể ảnh."""
-    from PIL import ImageEnhance, ImageFilter
-    
+def detect_landmark_strict(pil_img, retries=3, max_calls=None, max_seconds=None):
+    """Nhận dạng địa danh với độ chính xác cao - thử song song nhiều biến thể ảnh trong giới hạn ngân sách."""
     if not OPENAI_ENABLED:
         raise ValueError("OpenAI API chưa khả dụng")
     
@@ -321,106 +530,22 @@ Chỉ trả về TÊN, không giải thích thêm."""
         ]
         return not any(invalid in name_lower for invalid in invalid_responses)
     
-    # 1. Thử với ảnh gốc (retries lần)
-    print(f"[RECOGNIZE] Trying original image ({retries} attempts)...")
-    for _ in range(retries):
-        name = ask(pil_img)
-        if is_valid_result(name):
-            print(f"[RECOGNIZE] ✅ Found with original: {name}")
-            return name
-    
-    # 2. Thử resize với nhiều tỷ lệ khác nhau
-    w, h = pil_img.size
-    for scale in [1.5, 0.75, 2.0, 0.5]:
-        print(f"[RECOGNIZE] Trying scale {scale}x...")
-        resized = pil_img.resize((int(w * scale), int(h * scale)), Image.Resampling.LANCZOS)
-        for _ in range(retries):
-            name = ask(resized)
-            if is_valid_result(name):
-                print(f"[RECOGNIZE] ✅ Found with scale {scale}x: {name}")
-                return name
-    
-    # 3. Tăng độ sắc nét (sharpness)
-    try:
-        print(f"[RECOGNIZE] Trying sharpness enhancement...")
-        enhancer = ImageEnhance.Sharpness(pil_img)
-        sharpened = enhancer.enhance(2.0)
-        for _ in range(retries):
-            name = ask(sharpened)
-            if is_valid_result(name):
-                print(f"[RECOGNIZE] ✅ Found with sharpness: {name}")
-                return name
-    except Exception:
-        pass
+    budget = {}
+    if max_calls is not None:
+        budget["max_calls"] = max_calls
+    if max_seconds is not None:
+        budget["max_seconds"] = max_seconds
     
-    # 4. Tăng độ tương phản (contrast)
-    try:
-        print(f"[RECOGNIZE] Trying contrast enhancement...")
-        enhancer = ImageEnhance.Contrast(pil_img)
-        contrasted = enhancer.enhance(1.5)
-        for _ in range(retries):
-            name = ask(contrasted)
-            if is_valid_result(name):
-                print(f"[RECOGNIZE] ✅ Found with contrast: {name}")
-                return name
-    except Exception:
-        pass
+    # Chuẩn hóa (xoay theo EXIF, RGB, giới hạn cạnh dài) trước khi tạo biến thể:
+    # biến thể tạo trên ảnh gốc lớn sẽ bị thu về cùng kích thước và gần như trùng nhau
+    pil_img = prepare_image_for_vision(pil_img)
+    found = strategy_engine.run(pil_img, ask, is_valid_result, retries=retries, **budget)
+    if found:
+        name, strategy = found
+        print(f"[RECOGNIZE] ✅ Found with {strategy}: {name}")
+        return name
     
-    # 5. Tăng độ sáng (brightness) - hữu ích cho ảnh tối
-    try:
-        print(f"[RECOGNIZE] Trying brightness enhancement...")
-        enhancer = ImageEnhance.Brightness(pil_img)
-        brightened = enhancer.enhance(1.3)
-        for _ in range(retries):
-            name = ask(brightened)
-            if is_valid_result(name):
-                print(f"[RECOGNIZE] ✅ Found with brightness: {name}")
-                return name
-    except Exception:
-        pass
-    
-    # 6. Áp dụng bộ lọc làm sắc nét (SHARPEN filter)
-    try:
-        print(f"[RECOGNIZE] Trying SHARPEN filter...")
-        filtered = pil_img.filter(ImageFilter.SHARPEN)
-        for _ in range(retries):
-            name = ask(filtered)
-            if is_valid_result(name):
-                print(f"[RECOGNIZE] ✅ Found with SHARPEN filter: {name}")
-                return name
-    except Exception:
-        pass
-    
-    # 7. Tăng chất lượng ảnh qua nén JPEG cao
-    try:
-        print(f"[RECOGNIZE] Trying high-quality JPEG compression...")
-        buf = BytesIO()
-        pil_img.convert("RGB").save(buf, format="JPEG", quality=95, optimize=True)
-        buf.seek(0)
-        img_enhanced = Image.open(buf)
-        for _ in range(retries):
-            name = ask(img_enhanced)
-            if is_valid_result(name):
-                print(f"[RECOGNIZE] ✅ Found with JPEG optimization: {name}")
-                return name
-    except Exception:
-        pass
-    
-    # 8. Kết hợp nhiều kỹ thuật: Sharpness + Contrast
-    try:
-        print(f"[RECOGNIZE] Trying combined enhancement (Sharpness + Contrast)...")
-        img_combo = pil_img.copy()
-        img_combo = ImageEnhance.Sharpness(img_combo).enhance(1.8)
-        img_combo = ImageEnhance.Contrast(img_combo).enhance(1.3)
-        for _ in range(retries):
-            name = ask(img_combo)
-            if is_valid_result(name):
-                print(f"[RECOGNIZE] ✅ Found with combined enhancement: {name}")
-                return name
-    except Exception:
-        pass
-    
-    print(f"[RECOGNIZE] ❌ Failed to recognize landmark after all attempts")
+    print(f"[RECOGNIZE] ❌ Failed to recognize landmark within budget")
     raise ValueError("Không nhận diện được địa danh sau nhiều lần thử với các kỹ thuật khác nhau")
 
 def get_gps_from_image(image_file):
@@ -452,18 +577,57 @@ def get_gps_from_image(image_file):
 def reverse_geocode(lat, lon):
     """Chuyển đổi tọa độ thành địa chỉ."""
     try:
-        geolocator = Nominatim(user_agent="album_locator")
-        location = geolocator.reverse((lat, lon), language="vi")
-        return location.address if location else None
+        return geocoder.reverse(lat, lon)
     except Exception:
         return None
 
+def locate_image(image_bytes):
+    """
+    Xác định vị trí ảnh: ưu tiên GPS trong EXIF, chỉ gọi vision khi cần.
+    
+    1. Có GPS và gần một địa danh trong database (GPS_MATCH_RADIUS_M): trả về địa danh đó
+    2. Không có GPS hoặc không gần địa danh nào: nhận dạng bằng OpenAI Vision
+    3. Vision không nhận ra nhưng có GPS: dùng tọa độ GPS + reverse geocoding
+    
+    Returns:
+        dict gồm landmark, description, confidence, lat, lon, address, source
+    """
+    gps = get_gps_from_image(BytesIO(image_bytes))
+    if gps:
+        lat, lon = gps
+        info, distance_m = landmark_registry.nearest(lat, lon)
+        if info:
+            print(f"[RECOGNIZE] GPS match: {info['name']} ({distance_m} m)")
+            return {
+                "landmark": info["name"],
+                "description": (info.get("introduction") or "")[:200],
+                "confidence": "high",
+                "lat": info["lat"],
+                "lon": info["lon"],
+                "address": _landmark_address(info),
+                "distance_m": distance_m,
+                "source": "gps"
+            }
+    
+    result = dict(get_landmark_with_confidence(Image.open(BytesIO(image_bytes))))
+    result["source"] = "vision"
+    if gps and result.get("lat") is None:
+        # Vision không xác định được: vẫn trả về vị trí thật của ảnh
+        result["lat"], result["lon"] = gps
+        result["address"] = reverse_geocode(*gps)
+        result["source"] = "gps_reverse_geocode"
+    return result
+
 def detect_location(image_file, image_pil):
     """Phát hiện vị trí từ ảnh (GPS hoặc OpenAI Vision API)."""
     # Thử lấy GPS từ EXIF
     gps = get_gps_from_image(image_file)
     if gps:
         lat, lon = gps
+        # Ảnh chụp tại địa danh đã biết: không cần gọi mạng
+        info, _ = landmark_registry.nearest(lat, lon)
+        if info:
+            return info["name"]
         place = reverse_geocode(lat, lon)
         if place:
             return place
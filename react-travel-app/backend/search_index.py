@@ -0,0 +1,174 @@
+"""
+Search Index Module - Chỉ mục đảo (inverted index) xếp hạng BM25 cho tìm kiếm địa điểm
+- Nhiều trường có trọng số: tên, tags, giới thiệu, review (BM25F)
+- Điểm từng (từ, địa điểm) được tính sẵn khi build, truy vấn chỉ cộng posting list
+- Khớp tiền tố (bisect trên từ điển) cho từ cuối đang gõ dở hoặc từ không có trong từ điển,
+  luôn xếp sau khớp chính xác; sai chính tả 1 ký tự (deletion neighborhood)
+- Cộng điểm khi từ có trong tên địa điểm và khi khớp nguyên cụm từ (search_phrases),
+  rating dùng để phân định khi bằng điểm
+"""
+
+import math
+import re
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+import unidecode
+
+# Trọng số các trường (tên quan trọng nhất)
+FIELD_WEIGHTS = {"name": 3.0, "tags": 2.0, "introduction": 1.0, "review": 0.5}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Hệ số cho từ khớp gần đúng (so với khớp chính xác)
+PREFIX_WEIGHT = 0.8
+TYPO_WEIGHT = 0.6
+# Độ dài tối thiểu để thử khớp tiền tố / sai chính tả
+MIN_PREFIX_LENGTH = 3
+MIN_TYPO_LENGTH = 4
+# Điểm cộng thêm cho mỗi cụm từ (tên/tag nhiều từ) xuất hiện nguyên vẹn trong truy vấn
+PHRASE_BOOST = 1.5
+# Điểm cộng thêm cho mỗi từ của truy vấn có đúng trong tên địa điểm
+# (từ ngắn như "cho", "pho" xuất hiện khắp phần giới thiệu nên IDF rất thấp)
+NAME_MATCH_BOOST = 1.0
+
+
+def tokenize(text) -> List[str]:
+    """Chữ thường, bỏ dấu, tách thành các từ [a-z0-9]."""
+    if not text:
+        return []
+    if isinstance(text, (list, tuple)):
+        text = " ".join(str(part) for part in text)
+    return re.findall(r"[a-z0-9]+", unidecode.unidecode(str(text).lower()))
+
+
+def _deletions(term: str):
+    """Các chuỗi có được khi xóa đúng 1 ký tự của term."""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+class SearchIndex:
+    """Chỉ mục BM25F trên danh sách địa điểm (dict có name, tags, introduction, review, search_phrases)."""
+
+    def __init__(self, destinations: Sequence):
+        self.destinations = list(destinations)
+        # term -> {doc_id: điểm BM25 đã tính sẵn}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._phrases: List[Tuple[str, ...]] = []
+        self._name_terms: List[frozenset] = []
+        self._ratings: List[float] = []
+
+        field_tokens = []
+        total_lengths = {field: 0 for field in FIELD_WEIGHTS}
+        for dest in self.destinations:
+            tokens = {field: tokenize(dest.get(field)) for field in FIELD_WEIGHTS}
+            field_tokens.append(tokens)
+            self._name_terms.append(frozenset(tokens["name"]))
+            for field in FIELD_WEIGHTS:
+                total_lengths[field] += len(tokens[field])
+            # Chỉ cụm nhiều từ mới có ý nghĩa cộng điểm cụm
+            phrases = (tokenize(phrase) for phrase in dest.get("search_phrases", ()))
+            self._phrases.append(tuple(" ".join(words) for words in phrases if len(words) > 1))
+            try:
+                self._ratings.append(float(dest.get("rating") or 0))
+            except (TypeError, ValueError):
+                self._ratings.append(0.0)
+
+        count = len(self.destinations)
+        avg_lengths = {field: (total / count if count else 0) or 1.0 for field, total in total_lengths.items()}
+
+        # Tần suất đã chuẩn hóa theo độ dài trường và nhân trọng số (BM25F)
+        weighted_tf: Dict[str, Dict[int, float]] = {}
+        for doc_id, tokens in enumerate(field_tokens):
+            for field, weight in FIELD_WEIGHTS.items():
+                terms = tokens[field]
+                if not terms:
+                    continue
+                norm = 1 - BM25_B + BM25_B * len(terms) / avg_lengths[field]
+                for term in terms:
+                    per_doc = weighted_tf.setdefault(term, {})
+                    per_doc[doc_id] = per_doc.get(doc_id, 0.0) + weight / norm
+
+        for term, per_doc in weighted_tf.items():
+            df = len(per_doc)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            self._postings[term] = {
+                doc_id: idf * tf * (BM25_K1 + 1) / (tf + BM25_K1)
+                for doc_id, tf in per_doc.items()
+            }
+
+        # Từ điển đã sắp xếp cho khớp tiền tố, và bảng xóa-1-ký-tự cho khớp sai chính tả
+        self._vocabulary = sorted(self._postings)
+        self._deletes: Dict[str, List[str]] = {}
+        for term in self._vocabulary:
+            if len(term) >= MIN_TYPO_LENGTH:
+                for deleted in _deletions(term):
+                    self._deletes.setdefault(deleted, []).append(term)
+
+    def __len__(self):
+        return len(self.destinations)
+
+    def _expand(self, token: str, is_last: bool = False) -> Dict[str, float]:
+        """
+        Các từ trong từ điển khớp với token: {term: hệ số}.
+
+        Chỉ mở rộng tiền tố khi token không có trong từ điển hoặc là từ cuối (đang gõ dở).
+        """
+        matches = {}
+        if token in self._postings:
+            matches[token] = 1.0
+
+        if len(token) >= MIN_PREFIX_LENGTH and (is_last or not matches):
+            i = bisect_left(self._vocabulary, token)
+            while i < len(self._vocabulary) and self._vocabulary[i].startswith(token):
+                matches.setdefault(self._vocabulary[i], PREFIX_WEIGHT)
+                i += 1
+
+        if len(token) >= MIN_TYPO_LENGTH and not matches:
+            # Khoảng cách sửa 1: thiếu, thừa hoặc sai 1 ký tự
+            candidates = set(self._deletes.get(token, ()))
+            for deleted in _deletions(token):
+                if deleted in self._postings:
+                    candidates.add(deleted)
+                candidates.update(self._deletes.get(deleted, ()))
+            for term in candidates:
+                matches.setdefault(term, TYPO_WEIGHT)
+        return matches
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[float, object]]:
+        """
+        Tìm các địa điểm phù hợp với truy vấn.
+
+        Returns:
+            [(điểm, địa điểm)] sắp theo điểm giảm dần, bằng điểm thì rating cao hơn trước
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        scores: Dict[int, float] = {}
+        for position, token in enumerate(tokens):
+            exact = self._postings.get(token, {})
+            # Từ mở rộng luôn thấp hơn mọi địa điểm khớp chính xác token này
+            cap = PREFIX_WEIGHT * min(exact.values()) if exact else None
+            # Mỗi token chỉ tính từ khớp tốt nhất trên mỗi địa điểm
+            best: Dict[int, float] = {}
+            for term, factor in self._expand(token, is_last=position == len(tokens) - 1).items():
+                for doc_id, score in self._postings[term].items():
+                    weighted = score * factor
+                    if term != token and cap is not None:
+                        weighted = min(weighted, cap)
+                    if weighted > best.get(doc_id, 0.0):
+                        best[doc_id] = weighted
+            for doc_id, score in best.items():
+                if token in self._name_terms[doc_id]:
+                    score += NAME_MATCH_BOOST
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+
+        normalized_query = " " + " ".join(tokens) + " "
+        for doc_id in scores:
+            for phrase in self._phrases[doc_id]:
+                if f" {phrase} " in normalized_query:
+                    scores[doc_id] += PHRASE_BOOST
+
+        ranked = sorted(scores.items(), key=lambda item: (-round(item[1], 9), -self._ratings[item[0]]))
+        return [(round(score, 4), self.destinations[doc_id]) for doc_id, score in ranked[:limit]]
@@ -1,22 +1,105 @@
 """
 Social Feed Module - Quản lý posts, comments, likes cho chức năng mạng xã hội
+Mỗi thay đổi được ghi nối vào event log (fsync) thay vì ghi lại toàn bộ file JSON;
+log được compact định kỳ thành snapshot (các file JSON) và replay khi khởi động.
+Ảnh của post nằm trong blob store, post chỉ giữ digest, loại ảnh và kích thước.
 """
 
 from datetime import datetime
-from typing import List, Dict, Optional
+from io import BytesIO
+from threading import RLock
+from typing import Iterable, List, Dict, Optional, Set
+import base64
 import json
 import os
+import tempfile
 
-# File lưu trữ posts và comments
+from PIL import Image
+
+from atomic_file import replace_file
+from blob_store import blob_store
+from event_log import EventLog
+from feed_index import FeedIndex, decode_cursor, encode_cursor
+
+# File lưu trữ posts và comments (snapshot)
 POSTS_FILE = "social_posts.json"
 COMMENTS_FILE = "social_comments.json"
 LIKES_FILE = "social_likes.json"
+# Event log các thay đổi kể từ snapshot gần nhất
+FEED_LOG_FILE = "social_feed.log.jsonl"
+# Compact khi log vượt quá số sự kiện / kích thước này
+FEED_COMPACT_EVENTS = int(os.getenv("FEED_COMPACT_EVENTS", "1000"))
+FEED_COMPACT_BYTES = int(os.getenv("FEED_COMPACT_BYTES", str(16 * 1024 * 1024)))
+# URL ảnh của post; bản cho feed là bản thu nhỏ cạnh dài SOCIAL_FEED_IMAGE_SIZE px
+SOCIAL_IMAGE_URL = "/api/social/images/{digest}"
+SOCIAL_FEED_IMAGE_SIZE = 512
+# Tag EXIF Orientation: các giá trị 5-8 xoay ảnh 90 độ
+EXIF_ORIENTATION = 0x0112
+
+def store_post_image(image_bytes: bytes) -> Dict:
+    """
+    Lưu ảnh của post vào blob store.
+    
+    Returns:
+        {"blob", "content_type", "width", "height"}; ValueError nếu không phải ảnh
+    """
+    try:
+        # Chỉ đọc header, không decode toàn bộ ảnh
+        img = Image.open(BytesIO(image_bytes))
+        width, height = img.size
+        orientation = img.getexif().get(EXIF_ORIENTATION)
+    except Exception as e:
+        raise ValueError("File is not a valid image") from e
+    content_type = Image.MIME.get(img.format or "")
+    if not content_type or not content_type.startswith("image/"):
+        raise ValueError(f"Unsupported image format: {img.format}")
+    if orientation in (5, 6, 7, 8):
+        # Kích thước sau khi xoay theo EXIF (giống bản thu nhỏ)
+        width, height = height, width
+    return {
+        "blob": blob_store.put(image_bytes),
+        "content_type": content_type,
+        "width": width,
+        "height": height
+    }
 
 class SocialFeedManager:
-    def __init__(self):
+    def __init__(self, log_file: str = FEED_LOG_FILE):
+        self._lock = RLock()
         self.posts = self.load_posts()
+        for post in self.posts.values():
+            # Bản cũ lưu nhầm liked_by_user (của người xem) vào post
+            post.pop('liked_by_user', None)
         self.comments = self.load_comments()
-        self.likes = self.load_likes()
+        self._image_types: Dict[str, str] = {}
+        self._image_refs: Dict[str, int] = {}
+        # Likes trong bộ nhớ là set: post_id -> {user_email}, kèm chỉ mục ngược user_email -> {post_id}
+        self.likes: Dict[str, Set[str]] = {post_id: set(users) for post_id, users in self.load_likes().items()}
+        self.user_likes: Dict[str, Set[str]] = {}
+        for post_id, users in self.likes.items():
+            for user_email in users:
+                self.user_likes.setdefault(user_email, set()).add(post_id)
+        # Chỉ mục feed theo (created_at, post_id)
+        self.feed_index = FeedIndex(self._feed_key(post) for post in self.posts.values())
+        # Chỉ mục theo tác giả: user_email -> FeedIndex
+        self.author_index: Dict[str, FeedIndex] = {}
+        for post in self.posts.values():
+            self._author_feed(post.get('user_email')).add(self._feed_key(post))
+            self._track_image(post, 1)
+        
+        # Replay các sự kiện chưa có trong snapshot
+        self.log = EventLog(log_file)
+        events = self.log.replay()
+        for event in events:
+            self._apply(event)
+        if events:
+            print(f"[SOCIAL] Replayed {len(events)} event(s) from {log_file}")
+        migrated = self._migrate_inline_images()
+        if events or migrated:
+            try:
+                self.compact()
+            except OSError as e:
+                print(f"[SOCIAL] Could not compact feed log: {e}")
     
     def load_posts(self) -> Dict:
         """Load posts từ file"""
@@ -48,25 +131,196 @@ class SocialFeedManager:
                 return {}
         return {}
     
-    def save_posts(self):
-        """Lưu posts vào file"""
-        with open(POSTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.posts, f, ensure_ascii=False, indent=2)
+    def _write_snapshot(self, path: str, data: Dict):
+        """Ghi snapshot nguyên tử (file tạm + fsync + rename)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".json")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            replace_file(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
     
-    def save_comments(self):
-        """Lưu comments vào file"""
-        with open(COMMENTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.comments, f, ensure_ascii=False, indent=2)
+    def compact(self):
+        """Ghi toàn bộ trạng thái thành snapshot rồi xóa event log."""
+        with self._lock:
+            # Crash giữa chừng vẫn an toàn: log còn nguyên và replay là idempotent
+            self._write_snapshot(POSTS_FILE, self.posts)
+            self._write_snapshot(COMMENTS_FILE, self.comments)
+            # Set được lưu thành list (bỏ các post không còn like nào)
+            self._write_snapshot(LIKES_FILE, {post_id: sorted(users) for post_id, users in self.likes.items() if users})
+            self.log.reset()
+            print(f"[SOCIAL] Compacted feed log into snapshots")
     
-    def save_likes(self):
-        """Lưu likes vào file"""
-        with open(LIKES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.likes, f, ensure_ascii=False, indent=2)
+    def _record(self, event: Dict):
+        """Ghi sự kiện vào log (write-ahead) rồi áp dụng vào bộ nhớ; gọi khi đang giữ lock."""
+        self.log.append(event)
+        self._apply(event)
+        if len(self.log) >= FEED_COMPACT_EVENTS or self.log.size() >= FEED_COMPACT_BYTES:
+            try:
+                self.compact()
+            except OSError as e:
+                # Sự kiện đã nằm trong log, lần compact sau sẽ thử lại
+                print(f"[SOCIAL] Could not compact feed log: {e}")
+    
+    def _migrate_inline_images(self) -> int:
+        """Chuyển ảnh data URI base64 của các post cũ sang blob store."""
+        migrated = 0
+        for post in self.posts.values():
+            image_data = post.get('image_data')
+            if not image_data or post.get('image_blob'):
+                continue
+            try:
+                image = store_post_image(base64.b64decode(image_data.split("base64,", 1)[-1]))
+            except ValueError as e:
+                print(f"[SOCIAL] Could not migrate image of {post['post_id']}: {e}")
+                continue
+            self._set_image(post, image)
+            post.pop('image_data', None)
+            self._track_image(post, 1)
+            migrated += 1
+        if migrated:
+            print(f"[SOCIAL] Migrated {migrated} inline image(s) to blob store")
+        return migrated
+    
+    @staticmethod
+    def _set_image(post: Dict, image: Dict):
+        post['image_blob'] = image['blob']
+        post['image_content_type'] = image['content_type']
+        post['image_width'] = image['width']
+        post['image_height'] = image['height']
+    
+    def _track_image(self, post: Dict, delta: int):
+        """Đếm số post dùng mỗi ảnh; chỉ ảnh đang được post dùng mới được serve."""
+        digest = post.get('image_blob')
+        if not digest:
+            return
+        refs = self._image_refs.get(digest, 0) + delta
+        if refs > 0:
+            self._image_refs[digest] = refs
+            self._image_types[digest] = post.get('image_content_type') or "image/jpeg"
+        else:
+            self._image_refs.pop(digest, None)
+            self._image_types.pop(digest, None)
     
-    def create_post(self, user_email: str, content: str, image_data: Optional[str] = None, 
+    def image_content_type(self, digest: str) -> Optional[str]:
+        """Content-Type của ảnh nếu digest thuộc một post hiện có, ngược lại None."""
+        return self._image_types.get(digest)
+    
+    @staticmethod
+    def _view(post: Dict) -> Dict:
+        """Bản sao của post để trả về client, kèm URL ảnh (bản cho feed và bản gốc)."""
+        view = dict(post)
+        digest = post.get('image_blob')
+        if digest:
+            url = SOCIAL_IMAGE_URL.format(digest=digest)
+            view['image_url'] = f"{url}?size={SOCIAL_FEED_IMAGE_SIZE}"
+            view['image_full_url'] = url
+        return view
+    
+    @staticmethod
+    def _feed_key(post: Dict):
+        return post.get('created_at', ''), post['post_id']
+    
+    def _author_feed(self, user_email: str) -> FeedIndex:
+        feed = self.author_index.get(user_email)
+        if feed is None:
+            feed = self.author_index[user_email] = FeedIndex()
+        return feed
+    
+    def _page(self, index: FeedIndex, limit: int, offset: int = 0, before: Optional[str] = None,
+              after: Optional[str] = None) -> Dict:
+        """Một trang posts của chỉ mục (newest first) kèm cursor."""
+        before_key = decode_cursor(before) if before else None
+        after_key = decode_cursor(after) if after else None
+        with self._lock:
+            keys, has_more = index.page(limit, before=before_key, after=after_key, offset=offset)
+            # Trả về bản sao để người gọi thêm field (liked_by_user...) không sửa post đã lưu
+            posts = [self._view(self.posts[post_id]) for _, post_id in keys]
+        return {
+            "posts": posts,
+            # Cursor để lấy trang cũ hơn (before=) và kiểm tra post mới (after=)
+            "next_cursor": encode_cursor(keys[-1]) if keys and has_more else None,
+            "prev_cursor": encode_cursor(keys[0]) if keys else None
+        }
+    
+    def _discard_user_like(self, user_email: str, post_id: str):
+        liked = self.user_likes.get(user_email)
+        if liked is not None:
+            liked.discard(post_id)
+            if not liked:
+                del self.user_likes[user_email]
+    
+    def _apply(self, event: Dict):
+        """Áp dụng một sự kiện vào bộ nhớ. Idempotent để replay lại sau snapshot không bị sai."""
+        op = event.get('op')
+        
+        if op == 'create_post':
+            post = event['post']
+            if post['post_id'] not in self.posts:
+                self.posts[post['post_id']] = post
+                self._track_image(post, 1)
+                self.feed_index.add(self._feed_key(post))
+                self._author_feed(post.get('user_email')).add(self._feed_key(post))
+        
+        elif op == 'delete_post':
+            post_id = event['post_id']
+            post = self.posts.pop(post_id, None)
+            if post:
+                self._track_image(post, -1)
+                self.feed_index.remove(self._feed_key(post))
+                author_feed = self.author_index.get(post.get('user_email'))
+                if author_feed is not None:
+                    author_feed.remove(self._feed_key(post))
+                    if not len(author_feed):
+                        del self.author_index[post.get('user_email')]
+            self.comments.pop(post_id, None)
+            for user_email in self.likes.pop(post_id, ()):
+                self._discard_user_like(user_email, post_id)
+        
+        elif op == 'add_comment':
+            comment = event['comment']
+            post_id = comment['post_id']
+            if post_id not in self.posts:
+                return
+            comments = self.comments.setdefault(post_id, [])
+            if not any(c.get('comment_id') == comment['comment_id'] for c in comments):
+                comments.append(comment)
+            self.posts[post_id]['comments_count'] = len(comments)
+        
+        elif op == 'delete_comment':
+            post_id = event['post_id']
+            comments = self.comments.get(post_id, [])
+            comments[:] = [c for c in comments if c.get('comment_id') != event['comment_id']]
+            if post_id in self.posts:
+                self.posts[post_id]['comments_count'] = len(comments)
+        
+        elif op in ('like', 'unlike'):
+            post_id = event['post_id']
+            if post_id not in self.posts:
+                return
+            likers = self.likes.setdefault(post_id, set())
+            user_email = event['user_email']
+            if op == 'like':
+                likers.add(user_email)
+                self.user_likes.setdefault(user_email, set()).add(post_id)
+            else:
+                likers.discard(user_email)
+                self._discard_user_like(user_email, post_id)
+            self.posts[post_id]['likes_count'] = len(likers)
+        
+        else:
+            print(f"[SOCIAL] Unknown feed event: {op}")
+    
+    def create_post(self, user_email: str, content: str, image: Optional[Dict] = None,
                    location: Optional[str] = None, user_avatar: Optional[str] = None,
                    user_fullname: Optional[str] = None) -> Dict:
-        """Tạo post mới"""
+        """Tạo post mới (image là kết quả của store_post_image)"""
         post_id = f"post_{datetime.now().timestamp()}"
         
         post = {
@@ -75,68 +329,78 @@ class SocialFeedManager:
             "user_avatar": user_avatar,
             "user_fullname": user_fullname,
             "content": content,
-            "image_data": image_data,
             "location": location,
             "created_at": datetime.now().isoformat(),
             "likes_count": 0,
             "comments_count": 0
         }
+        if image:
+            self._set_image(post, image)
         
-        self.posts[post_id] = post
-        self.save_posts()
+        with self._lock:
+            self._record({"op": "create_post", "post": post})
         
-        return post
+        return self._view(post)
     
-    def get_posts(self, limit: int = 20, offset: int = 0) -> List[Dict]:
+    def get_posts(self, limit: int = 20, offset: int = 0, before: Optional[str] = None,
+                  after: Optional[str] = None) -> List[Dict]:
         """Lấy danh sách posts (newest first)"""
-        posts_list = list(self.posts.values())
-        # Sort by created_at descending
-        posts_list.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        return self.get_posts_page(limit=limit, offset=offset, before=before, after=after)['posts']
+    
+    def get_posts_page(self, limit: int = 20, offset: int = 0, before: Optional[str] = None,
+                       after: Optional[str] = None) -> Dict:
+        """
+        Lấy một trang posts (newest first) theo cursor hoặc offset.
+        
+        Args:
+            before: Cursor, lấy các post cũ hơn (trang tiếp theo)
+            after: Cursor, lấy các post mới hơn (post mới đăng)
         
-        # Apply pagination
-        return posts_list[offset:offset + limit]
+        Returns:
+            {"posts", "next_cursor", "prev_cursor"}; ValueError nếu cursor không hợp lệ
+        """
+        return self._page(self.feed_index, limit, offset=offset, before=before, after=after)
     
     def get_post_by_id(self, post_id: str) -> Optional[Dict]:
-        """Lấy post theo ID"""
-        return self.posts.get(post_id)
+        """Lấy post theo ID (bản sao)"""
+        post = self.posts.get(post_id)
+        return self._view(post) if post else None
     
-    def get_user_posts(self, user_email: str, limit: int = 20) -> List[Dict]:
+    def get_user_posts(self, user_email: str, limit: int = 20, before: Optional[str] = None) -> List[Dict]:
         """Lấy posts của một user"""
-        user_posts = [p for p in self.posts.values() if p.get('user_email') == user_email]
-        user_posts.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        return user_posts[:limit]
+        return self.get_user_posts_page(user_email, limit=limit, before=before)['posts']
+    
+    def get_user_posts_page(self, user_email: str, limit: int = 20, offset: int = 0,
+                            before: Optional[str] = None, after: Optional[str] = None) -> Dict:
+        """Một trang posts của user (newest first), kèm cursor và tổng số post của user."""
+        with self._lock:
+            index = self.author_index.get(user_email) or FeedIndex()
+            page = self._page(index, limit, offset=offset, before=before, after=after)
+            page["total_posts"] = len(index)
+        return page
+    
+    def count_user_posts(self, user_email: str) -> int:
+        """Số post của user"""
+        index = self.author_index.get(user_email)
+        return len(index) if index is not None else 0
     
     def delete_post(self, post_id: str, user_email: str) -> bool:
         """Xóa post (chỉ user tạo post mới được xóa)"""
-        post = self.posts.get(post_id)
-        if not post:
-            return False
-        
-        if post.get('user_email') != user_email:
-            return False
-        
-        # Xóa post
-        del self.posts[post_id]
-        
-        # Xóa comments của post
-        if post_id in self.comments:
-            del self.comments[post_id]
-        
-        # Xóa likes của post
-        if post_id in self.likes:
-            del self.likes[post_id]
-        
-        self.save_posts()
-        self.save_comments()
-        self.save_likes()
+        with self._lock:
+            post = self.posts.get(post_id)
+            if not post:
+                return False
+            
+            if post.get('user_email') != user_email:
+                return False
+            
+            # Xóa post cùng comments và likes của post
+            self._record({"op": "delete_post", "post_id": post_id})
         
         return True
     
     def add_comment(self, post_id: str, user_email: str, content: str, user_avatar: str = None, user_fullname: str = None) -> Optional[Dict]:
         """Thêm comment vào post"""
-        if post_id not in self.posts:
-            return None
-        
         comment_id = f"comment_{datetime.now().timestamp()}"
         
         comment = {
@@ -149,17 +413,11 @@ class SocialFeedManager:
             "created_at": datetime.now().isoformat()
         }
         
-        # Khởi tạo list comments cho post nếu chưa có
-        if post_id not in self.comments:
-            self.comments[post_id] = []
-        
-        self.comments[post_id].append(comment)
-        
-        # Cập nhật comment count
-        self.posts[post_id]['comments_count'] = len(self.comments[post_id])
-        
-        self.save_comments()
-        self.save_posts()
+        with self._lock:
+            if post_id not in self.posts:
+                return None
+            # Cập nhật comment count trong _apply
+            self._record({"op": "add_comment", "comment": comment})
         
         return comment
     
@@ -172,60 +430,54 @@ class SocialFeedManager:
     
     def delete_comment(self, post_id: str, comment_id: str, user_email: str) -> bool:
         """Xóa comment"""
-        if post_id not in self.comments:
-            return False
-        
-        comments = self.comments[post_id]
-        
-        for i, comment in enumerate(comments):
-            if comment.get('comment_id') == comment_id:
-                # Chỉ user tạo comment hoặc user tạo post mới được xóa
-                post = self.posts.get(post_id)
-                if comment.get('user_email') == user_email or (post and post.get('user_email') == user_email):
-                    comments.pop(i)
-                    
-                    # Cập nhật comment count
-                    self.posts[post_id]['comments_count'] = len(comments)
-                    
-                    self.save_comments()
-                    self.save_posts()
-                    return True
+        with self._lock:
+            if post_id not in self.comments:
+                return False
+            
+            for comment in self.comments[post_id]:
+                if comment.get('comment_id') == comment_id:
+                    # Chỉ user tạo comment hoặc user tạo post mới được xóa
+                    post = self.posts.get(post_id)
+                    if comment.get('user_email') == user_email or (post and post.get('user_email') == user_email):
+                        self._record({"op": "delete_comment", "post_id": post_id, "comment_id": comment_id})
+                        return True
         
         return False
     
     def toggle_like(self, post_id: str, user_email: str) -> Dict:
         """Toggle like/unlike post"""
-        if post_id not in self.posts:
-            return {"success": False, "message": "Post not found"}
-        
-        # Khởi tạo set likes cho post nếu chưa có
-        if post_id not in self.likes:
-            self.likes[post_id] = []
-        
-        likes_list = self.likes[post_id]
-        
-        if user_email in likes_list:
-            # Unlike
-            likes_list.remove(user_email)
-            self.posts[post_id]['likes_count'] = len(likes_list)
-            self.save_likes()
-            self.save_posts()
-            return {"success": True, "action": "unliked", "likes_count": len(likes_list)}
-        else:
-            # Like
-            likes_list.append(user_email)
-            self.posts[post_id]['likes_count'] = len(likes_list)
-            self.save_likes()
-            self.save_posts()
-            return {"success": True, "action": "liked", "likes_count": len(likes_list)}
+        with self._lock:
+            if post_id not in self.posts:
+                return {"success": False, "message": "Post not found"}
+            
+            # Ghi sự kiện like/unlike tường minh (không phải toggle) để replay idempotent
+            action = "unliked" if user_email in self.likes.get(post_id, ()) else "liked"
+            self._record({"op": "unlike" if action == "unliked" else "like", "post_id": post_id, "user_email": user_email})
+            return {"success": True, "action": action, "likes_count": len(self.likes.get(post_id, ()))}
     
     def get_likes(self, post_id: str) -> List[str]:
         """Lấy danh sách users đã like post"""
-        return self.likes.get(post_id, [])
+        with self._lock:
+            return sorted(self.likes.get(post_id, ()))
     
     def is_liked_by_user(self, post_id: str, user_email: str) -> bool:
         """Kiểm tra user đã like post chưa"""
-        return user_email in self.likes.get(post_id, [])
+        return user_email in self.likes.get(post_id, ())
+    
+    def liked_by_user(self, post_ids: Iterable[str], user_email: str) -> Set[str]:
+        """Các post trong post_ids mà user đã like (một lần tra cho cả trang)"""
+        with self._lock:
+            liked = self.user_likes.get(user_email)
+            if not liked:
+                return set()
+            return {post_id for post_id in post_ids if post_id in liked}
+    
+    def with_liked_by_user(self, posts: List[Dict], user_email: str) -> List[Dict]:
+        """Gắn liked_by_user vào các post (bản sao do get_posts... trả về)"""
+        liked = self.liked_by_user((post['post_id'] for post in posts), user_email)
+        for post in posts:
+            post['liked_by_user'] = post['post_id'] in liked
+        return posts
 
 # Global instance
 social_feed_manager = SocialFeedManager()
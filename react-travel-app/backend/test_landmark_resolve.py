@@ -0,0 +1,65 @@
+"""
+Test script kiểm tra tra mờ tên địa danh (LandmarkRegistry.resolve / lookup)
+Chạy: python test_landmark_resolve.py (hoặc pytest)
+"""
+import os
+
+from database_file import DatabaseFile
+from recognize import LandmarkRegistry, FUZZY_MATCH_THRESHOLD
+
+DATABASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.json")
+registry = LandmarkRegistry(DatabaseFile(DATABASE_FILE))
+
+# (tên nhận dạng được, địa danh mong đợi)
+POSITIVE_CASES = [
+    ("Nhà thờ Đức Bà", "Nhà thờ Đức Bà"),
+    ("cho ben thanh", "Chợ Bến Thành"),
+    ("Bến Thành", "Chợ Bến Thành"),
+    ("Vincom", "Vincom Center Đồng Khởi"),
+    ("Bitexco", "Bitexco Tower"),
+    ("Bưu điện Sài Gòn", "Bưu điện Trung tâm Sài Gòn"),
+    ("Nha tho Duc Ba Sai Gon", "Nhà thờ Đức Bà"),
+    ("Chợ Bến Thành market", "Chợ Bến Thành"),
+    ("Thảo Cầm Viên", "Thảo Cầm Viên Sài Gòn"),
+    ("Chợ Lớn", "Khu ChinaTown (Chợ Lớn)"),
+    ("Landmark81", "Landmark 81"),
+    ("Bitexco Towr", "Bitexco Tower"),
+]
+
+# Chỉ trùng từ chung chung / khác từ đặc trưng: phải trả về None để dùng geocoding
+NEGATIVE_CASES = [
+    "Nhà thờ Tân Định",
+    "Chợ Bình Tây",
+    "Landmark 72",
+    "Chợ",
+    "Công viên",
+    "Dinh Độc Lập",
+    "Hồ Con Rùa",
+]
+
+
+def test_positive_matches():
+    for query, expected in POSITIVE_CASES:
+        info, score = registry.resolve(query)
+        assert info is not None and info["name"] == expected, f"{query!r} -> {info and info['name']!r} ({score})"
+        assert score >= FUZZY_MATCH_THRESHOLD, f"{query!r} score {score} below threshold"
+
+
+def test_generic_or_different_names_do_not_match():
+    for query in NEGATIVE_CASES:
+        info, score = registry.resolve(query)
+        assert registry.lookup(query) is None, f"{query!r} wrongly matched {info['name']!r} ({score})"
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("TEST LANDMARK RESOLVE")
+    print("=" * 70)
+    for query, expected in POSITIVE_CASES:
+        info, score = registry.resolve(query)
+        ok = info is not None and info["name"] == expected and score >= FUZZY_MATCH_THRESHOLD
+        print(f"   {'✅' if ok else '❌'} {query!r} -> {info and info['name']!r} ({score})")
+    for query in NEGATIVE_CASES:
+        info, score = registry.resolve(query)
+        ok = registry.lookup(query) is None
+        print(f"   {'✅' if ok else '❌'} {query!r} -> no match (best: {info and info['name']!r}, {score})")
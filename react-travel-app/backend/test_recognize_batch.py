@@ -0,0 +1,69 @@
+"""
+Test endpoint /api/recognize/batch: nhiều file và nhiều blob trong cùng một request
+Chạy: pytest test_recognize_batch.py (nhận dạng và album được thay bằng dữ liệu giả)
+"""
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+# main đọc/ghi dữ liệu theo đường dẫn tương đối: chạy trên bản sao để không sửa file trong repo
+WORK_DIR = tempfile.mkdtemp(prefix="recognize_batch_")
+for path in glob.glob(os.path.join(BACKEND_DIR, "*.json")) + glob.glob(os.path.join(BACKEND_DIR, "*.csv")):
+    shutil.copy(path, WORK_DIR)
+os.chdir(WORK_DIR)
+
+import main  # noqa: E402
+
+BLOBS = {main.blob_store.digest(data): data for data in (b"image-c", b"image-a")}
+
+
+def test_batch_accepts_several_files_and_blobs(monkeypatch):
+    recognized = []
+
+    async def fake_recognize(image_bytes):
+        recognized.append(image_bytes)
+        return {"landmark": image_bytes.decode(), "confidence": "high"}
+
+    monkeypatch.setattr(main, "recognize_image_async", fake_recognize)
+    monkeypatch.setattr(main, "verify_token", lambda authorization: "batch@test.com")
+    monkeypatch.setattr(main, "load_user_albums",
+                        lambda user_email: {"album": [{"blob": digest} for digest in BLOBS]})
+    monkeypatch.setattr(main.blob_store, "get", BLOBS.get)
+
+    files = [
+        ("files", ("a.jpg", b"image-a", "image/jpeg")),
+        ("files", ("b.jpg", b"image-b", "image/jpeg")),
+        ("files", ("a_copy.jpg", b"image-a", "image/jpeg")),
+        ("files", ("notes.txt", b"text", "text/plain")),
+    ]
+    response = TestClient(main.app).post(
+        "/api/recognize/batch",
+        files=files,
+        data={"blobs": list(BLOBS) + ["missing"]},
+        headers={"Authorization": "Bearer token"},
+    )
+    assert response.status_code == 200, response.text
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    summary = lines.pop()
+    assert summary == {"done": True, "total": 7, "unique": 3}
+
+    by_index = {line["index"]: line for line in lines}
+    assert sorted(by_index) == list(range(7))
+    assert [by_index[i]["landmark"] for i in (0, 1, 2, 4, 5)] == ["image-a", "image-b", "image-a", "image-c", "image-a"]
+    assert not by_index[3]["success"] and not by_index[6]["success"]
+    # Ảnh trùng nội dung (file và blob) chỉ nhận dạng một lần
+    assert sorted(recognized) == [b"image-a", b"image-b", b"image-c"]
+
+
+def test_batch_requires_input():
+    response = TestClient(main.app).post("/api/recognize/batch")
+    assert response.status_code == 400
@@ -0,0 +1,60 @@
+"""
+Test script kiểm tra thứ hạng tìm kiếm BM25F (SearchIndex.search) với truy vấn ngắn
+Chạy: python test_search_index.py (hoặc pytest)
+"""
+import json
+import os
+
+from search_index import SearchIndex
+
+DATABASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.json")
+with open(DATABASE_FILE, "r", encoding="utf-8") as f:
+    index = SearchIndex(json.load(f))
+
+# (truy vấn, địa điểm phải đứng đầu)
+TOP_CASES = [
+    ("chợ", "Chợ Bến Thành"),
+    ("cho", "Chợ Bến Thành"),
+    ("phở", "Phở Hòa Pasteur"),
+    ("cho ben thanh", "Chợ Bến Thành"),
+    ("ben th", "Chợ Bến Thành"),
+    ("landmark", "Landmark 81"),
+    ("bún", "Bún Thịt Nướng Cô Năm"),
+]
+
+# (truy vấn, từ phải có trong tên của cả top 3)
+TOP3_CASES = [
+    ("bảo tàng", "Bảo tàng"),
+    ("bảo tàg", "Bảo tàng"),
+    ("bao ta", "Bảo tàng"),
+    ("công viên", "Công viên"),
+]
+
+
+def names(query, limit=5):
+    return [dest["name"] for _, dest in index.search(query, limit=limit)]
+
+
+def test_short_queries_rank_exact_name_first():
+    for query, expected in TOP_CASES:
+        result = names(query)
+        assert result and result[0] == expected, f"{query!r} -> {result}"
+
+
+def test_short_queries_top3():
+    for query, word in TOP3_CASES:
+        result = names(query, limit=3)
+        assert len(result) == 3 and all(word in name for name in result), f"{query!r} -> {result}"
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("TEST SEARCH RANKING")
+    print("=" * 70)
+    for query, expected in TOP_CASES:
+        result = names(query)
+        print(f"   {'✅' if result and result[0] == expected else '❌'} {query!r} -> {result}")
+    for query, word in TOP3_CASES:
+        result = names(query, limit=3)
+        ok = len(result) == 3 and all(word in name for name in result)
+        print(f"   {'✅' if ok else '❌'} {query!r} -> {result}")